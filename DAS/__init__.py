@@ -1,4 +1,10 @@
 from DAS.simulator import *
+from DAS.planner import *
+from DAS.cost import *
+from DAS.telemetry import *
+from DAS.memory import *
 from DAS.shape import *
+from DAS.cube import *
+from DAS.surrogate import *
 from DAS.visualizer import *
 from DAS.visualizor import *
@@ -1,16 +1,24 @@
 #!/bin/python3
 
 import random
+import numpy as np
 from bitarray import bitarray
 from bitarray.util import zeros
+from itertools import chain
 
 class Block:
     """This class represents a block in the Ethereum blockchain."""
 
-    def __init__(self, blockSize):
-        """Initialize the block with a data array of blocksize^2 zeros."""
+    def __init__(self, blockSize, buffer = None):
+        """Initialize the block with a data array of blocksize^2 zeros.
+
+            If a buffer is given, the data is a view on it instead of a new array.
+        """
         self.blockSize = blockSize
-        self.data = zeros(self.blockSize*self.blockSize)
+        if buffer is None:
+            self.data = zeros(self.blockSize*self.blockSize)
+        else:
+            self.data = bitarray(buffer=buffer)
 
     def fill(self):
         """It fills the block data with ones."""
@@ -81,3 +89,168 @@ class Block:
             print(line+"|")
         print(dash)
 
+
+
+class SparseBlock:
+    """This class represents the part of a block a validator is in custody of.
+
+    Only the rows and columns listed at creation are stored. Segments at the
+    intersection of an owned row and an owned column are stored twice, and
+    every write keeps both copies consistent. The interface mirrors Block.
+    """
+
+    def __init__(self, blockSize, rowIDs, columnIDs):
+        """Initialize the block with an empty line for each owned row/column."""
+        self.blockSize = blockSize
+        self.rows = {id: zeros(self.blockSize) for id in rowIDs}
+        self.columns = {id: zeros(self.blockSize) for id in columnIDs}
+
+    def fill(self):
+        """It fills all the owned lines with ones."""
+        for line in chain(self.rows.values(), self.columns.values()):
+            line.setall(1)
+
+    def merge(self, merged):
+        """It merges (OR) the existing block with a received one of the same layout."""
+        for id, line in self.rows.items():
+            line |= merged.rows[id]
+        for id, line in self.columns.items():
+            line |= merged.columns[id]
+
+    def getSegment(self, rowID, columnID):
+        """Check whether a segment is included"""
+        if rowID in self.rows:
+            return self.rows[rowID][columnID]
+        if columnID in self.columns:
+            return self.columns[columnID][rowID]
+        return 0
+
+    def setSegment(self, rowID, columnID, value = 1):
+        """Set value for a segment (default 1) in all the lines storing it"""
+        if rowID in self.rows:
+            self.rows[rowID][columnID] = value
+        if columnID in self.columns:
+            self.columns[columnID][rowID] = value
+
+    def getColumn(self, columnID):
+        """It returns the block column corresponding to columnID."""
+        if columnID in self.columns:
+            return self.columns[columnID].copy()
+        column = zeros(self.blockSize)
+        for id, line in self.rows.items():
+            column[id] = line[columnID]
+        return column
+
+    def mergeColumn(self, columnID, column):
+        """It merges (OR) the existing column with the received one."""
+        if columnID in self.columns:
+            self.columns[columnID] |= column
+        for id, line in self.rows.items():
+            if column[id]:
+                line[columnID] = 1
+
+    def repairColumn(self, id):
+        """It repairs the entire column if it has at least blockSize/2 ones.
+            Returns: list of repaired segments
+        """
+        line = self.columns[id]
+        success = line.count(1)
+        if success >= self.blockSize/2:
+            ret = ~line
+            line.setall(1)
+            for row in self.rows.values():
+                row[id] = 1
+        else:
+            ret = zeros(self.blockSize)
+        return ret
+
+    def getRow(self, rowID):
+        """It returns the block row corresponding to rowID."""
+        if rowID in self.rows:
+            return self.rows[rowID].copy()
+        row = zeros(self.blockSize)
+        for id, line in self.columns.items():
+            row[id] = line[rowID]
+        return row
+
+    def mergeRow(self, rowID, row):
+        """It merges (OR) the existing row with the received one."""
+        if rowID in self.rows:
+            self.rows[rowID] |= row
+        for id, line in self.columns.items():
+            if row[id]:
+                line[rowID] = 1
+
+    def repairRow(self, id):
+        """It repairs the entire row if it has at least blockSize/2 ones.
+            Returns: list of repaired segments.
+        """
+        line = self.rows[id]
+        success = line.count(1)
+        if success >= self.blockSize/2:
+            ret = ~line
+            line.setall(1)
+            for column in self.columns.values():
+                column[id] = 1
+        else:
+            ret = zeros(self.blockSize)
+        return ret
+
+    def print(self):
+        """It prints the owned lines in the terminal (outside of the logger rules))."""
+        dash = "-" * (self.blockSize+2)
+        print(dash)
+        for i in range(self.blockSize):
+            print("|"+self.getRow(i).to01()+"|")
+        print(dash)
+
+
+class BlockStore:
+    """This class holds the blocks of all the nodes in one contiguous array.
+
+    Each node owns one row of packed bits (blockSize^2 bits, big endian) and
+    its Block is a view on that row, so the whole network state can be
+    queried at once. If a path is given, the array is a memory-mapped .npy
+    file, which other processes can open with np.load(path, mmap_mode='r').
+    """
+
+    def __init__(self, blockSize, numberNodes, path = None):
+        """It allocates the array for numberNodes blocks of blockSize^2 segments."""
+        self.blockSize = blockSize
+        self.numberNodes = numberNodes
+        self.path = path
+        rowBytes = (blockSize * blockSize) // 8
+        if path:
+            self.array = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(numberNodes, rowBytes))
+        else:
+            self.array = np.zeros((numberNodes, rowBytes), dtype=np.uint8)
+
+    @staticmethod
+    def fits(blockSize):
+        """Blocks are byte aligned views, so blockSize^2 must be a multiple of 8."""
+        return (blockSize * blockSize) % 8 == 0
+
+    def getBlock(self, nodeID):
+        """It returns the block of a node, as a view on the store."""
+        return Block(self.blockSize, self.array[nodeID])
+
+    def segmentHolders(self, nodes = slice(None), chunk = 256):
+        """It returns how many of the given nodes have each segment (blockSize x blockSize)."""
+        array = self.array[nodes]
+        holders = np.zeros(self.blockSize * self.blockSize, dtype=np.int64)
+        for i in range(0, len(array), chunk):
+            holders += np.unpackbits(array[i:i+chunk], axis=1).sum(axis=0, dtype=np.int64)
+        return holders.reshape(self.blockSize, self.blockSize)
+
+    def segmentsPerNode(self, nodes = slice(None), chunk = 256):
+        """It returns how many segments each of the given nodes has."""
+        array = self.array[nodes]
+        counts = np.zeros(len(array), dtype=np.int64)
+        for i in range(0, len(array), chunk):
+            counts[i:i+chunk] = np.unpackbits(array[i:i+chunk], axis=1).sum(axis=1, dtype=np.int64)
+        return counts
+
+    def flush(self):
+        """It flushes a memory-mapped store to disk."""
+        if self.path:
+            self.array.flush()
@@ -0,0 +1,85 @@
+#!/bin/python3
+
+import os
+import numpy as np
+import xml.etree.ElementTree as ET
+
+class CostModel:
+    """This class estimates the run time of a shape, to dispatch the longest shapes first.
+
+    The prior cost of a shape is the number of segments nodes keep in
+    custody (nodes x custody lines x blockSize). The model fits a log-linear
+    correction of the prior from the run times of past simulations, found
+    in the results folder. It is regularized towards the prior, so that
+    parameters never seen in the past keep their prior cost.
+    """
+
+    # Result fields read from the XML files: shape parameters, then the target
+    fields = ["numberNodes", "blockSize", "chi", "vpn1", "vpn2", "class1ratio", "failureRate"]
+    target = "runTime"
+
+    def __init__(self, regularization = 1.0):
+        """It initializes the model with the prior (no correction)."""
+        self.regularization = regularization
+        self.coefficients = np.zeros(5)
+        self.samples = 0
+
+    @staticmethod
+    def custodyLines(blockSize, chi, vpn1, vpn2, class1ratio):
+        """It returns the average number of rows (or columns) in custody of a node."""
+        return class1ratio * min(blockSize, chi * vpn1) + (1 - class1ratio) * min(blockSize, chi * vpn2)
+
+    def prior(self, logs):
+        """It returns the log prior cost from log numberNodes, blockSize and custody lines."""
+        return logs.sum()
+
+    def features(self, numberNodes, blockSize, chi, vpn1, vpn2, class1ratio, failureRate):
+        """It returns the log prior cost and the features of the correction."""
+        custody = max(self.custodyLines(blockSize, chi, vpn1, vpn2, class1ratio), 1)
+        logs = np.log([numberNodes, blockSize, custody])
+        return self.prior(logs), np.concatenate(([1], logs, [failureRate / 100]))
+
+    def fit(self, samples):
+        """It fits the correction from samples of the shape parameters (fields) followed by the target."""
+        samples = [s for s in samples if s[-1] > 0]
+        self.samples = len(samples)
+        if not samples:
+            return self
+        priors, X = zip(*(self.features(*s[:-1]) for s in samples))
+        X = np.array(X)
+        y = np.log([s[-1] for s in samples]) - np.array(priors)
+        A = X.T @ X + self.regularization * np.eye(X.shape[1])
+        self.coefficients = np.linalg.solve(A, X.T @ y)
+        return self
+
+    def estimate(self, shape):
+        """It returns the estimated target of a shape (relative, if not fitted)."""
+        prior, x = self.features(shape.numberNodes, shape.blockSize, shape.chi, shape.vpn1,
+                                 shape.vpn2, shape.class1ratio, shape.failureRate)
+        return float(np.exp(prior + x @ self.coefficients))
+
+    @classmethod
+    def fromResults(cls, path = "results"):
+        """It fits a model from the simulations in a results folder.
+
+            Results copied from equivalent shapes, and results without a
+            (positive) target, are ignored.
+        """
+        samples = []
+        if os.path.isdir(path):
+            for execID in os.listdir(path):
+                folder = os.path.join(path, execID)
+                if not os.path.isdir(folder):
+                    continue
+                for filename in os.listdir(folder):
+                    if not filename.endswith(".xml"):
+                        continue
+                    try:
+                        root = ET.parse(os.path.join(folder, filename)).getroot()
+                        alias = root.find("aliasOf")
+                        if alias is not None and alias.text:
+                            continue
+                        samples.append([float(root.find(field).text) for field in cls.fields + [cls.target]])
+                    except (ET.ParseError, AttributeError, TypeError, ValueError):
+                        continue
+        return cls().fit(samples)
@@ -0,0 +1,119 @@
+#!/bin/python3
+
+import os
+import numpy as np
+import xml.etree.ElementTree as ET
+
+class ResultCube:
+    """This class indexes the results of a study in N-d arrays, one axis per shape parameter.
+
+    Each cell holds, for one value of every parameter, the number of results,
+    the number of them where the block became available, and the sum of their
+    time to availability. Slices aggregate the cells over all the axes that
+    are neither selected nor fixed (e.g. over runs). The cube is built once
+    from the XML results of a folder, and cached in the folder (cube.npz).
+    """
+
+    parameters = ['run', 'blockSize', 'failureModel', 'failureRate', 'numberNodes', 'netDegree', 'chi',
+                  'vpn1', 'vpn2', 'class1ratio', 'bwUplinkProd', 'bwUplink1', 'bwUplink2']
+    cacheName = "cube.npz"
+
+    def __init__(self, axes, count, available, ttaSum):
+        """It initializes the cube from the values of each axis and the cell arrays."""
+        self.axes = axes
+        self.count = count
+        self.available = available
+        self.ttaSum = ttaSum
+
+    @staticmethod
+    def parseValue(element):
+        """It converts the text of an XML element according to its type attribute."""
+        kind = element.get("type")
+        if kind == "int":
+            return int(element.text)
+        if kind == "float":
+            return float(element.text)
+        return element.text
+
+    @classmethod
+    def build(cls, folder):
+        """It builds the cube from the XML results of a folder."""
+        records = []
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith(".xml"):
+                root = ET.parse(os.path.join(folder, filename)).getroot()
+                values = [cls.parseValue(root.find(param)) for param in cls.parameters]
+                records.append((values, int(root.find("blockAvailable").text), float(root.find("tta").text)))
+
+        axes = {param: np.array(sorted(set(r[0][i] for r in records))) for i, param in enumerate(cls.parameters)}
+        shape = tuple(max(len(axes[param]), 1) for param in cls.parameters)
+        count = np.zeros(shape, dtype=np.int32)
+        available = np.zeros(shape, dtype=np.int32)
+        ttaSum = np.zeros(shape, dtype=np.float64)
+        for values, blockAvailable, tta in records:
+            cell = tuple(int(np.searchsorted(axes[param], value)) for param, value in zip(cls.parameters, values))
+            count[cell] += 1
+            if blockAvailable == 1:
+                available[cell] += 1
+                ttaSum[cell] += tta
+        return cls(axes, count, available, ttaSum)
+
+    def save(self, path):
+        """It saves the cube in a npz file."""
+        np.savez_compressed(path, **{"axis_"+param: values for param, values in self.axes.items()},
+                            count=self.count, available=self.available, ttaSum=self.ttaSum)
+
+    @classmethod
+    def load(cls, folder):
+        """It returns the cube of a results folder, from the cache if it is up to date."""
+        path = os.path.join(folder, cls.cacheName)
+        xmls = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".xml")]
+        if os.path.exists(path) and all(os.path.getmtime(f) <= os.path.getmtime(path) for f in xmls):
+            with np.load(path) as cached:
+                if int(cached["count"].sum()) == len(xmls):
+                    axes = {param: cached["axis_"+param] for param in cls.parameters}
+                    return cls(axes, cached["count"], cached["available"], cached["ttaSum"])
+        cube = cls.build(folder)
+        cube.save(path)
+        return cube
+
+    def slice(self, x, y = None, metric = "tta", **where):
+        """It returns a 1-D (x) or 2-D (x, y) slice of a metric, and the values of its axes.
+
+            Parameters in where are fixed to the given values, all the other
+            axes are aggregated. Metrics are "tta" (mean over the available
+            results, nan if none), "availability" (ratio of available
+            results, nan if none) and "count" (number of results).
+            Returns: (values, x values, y values or None)
+        """
+        index = []
+        for param in self.parameters:
+            if param in where:
+                position = np.flatnonzero(self.axes[param] == where[param])
+                if not len(position):
+                    raise KeyError("No results with %s = %s" % (param, where[param]))
+                index.append(int(position[0]))
+            else:
+                index.append(slice(None))
+        kept = [param for param in self.parameters if param not in where]
+        selected = [x] if y is None else [x, y]
+        aggregated = tuple(i for i, param in enumerate(kept) if param not in selected)
+
+        def reduce(array):
+            reduced = array[tuple(index)].sum(axis=aggregated)
+            # remaining axes are in parameter order, put them in the requested order
+            remaining = [param for param in kept if param in selected]
+            return np.transpose(reduced, [remaining.index(param) for param in selected])
+
+        count = reduce(self.count)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if metric == "count":
+                values = count
+            elif metric == "availability":
+                values = np.where(count > 0, reduce(self.available) / count, np.nan)
+            elif metric == "tta":
+                available = reduce(self.available)
+                values = np.where(available > 0, reduce(self.ttaSum) / available, np.nan)
+            else:
+                raise ValueError("Unknown metric %s" % metric)
+        return values, self.axes[x], None if y is None else self.axes[y]
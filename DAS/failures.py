@@ -0,0 +1,106 @@
+#!/bin/python3
+
+import numpy as np
+from bitarray import bitarray, frozenbitarray
+
+# Registered failure models: name -> (generator, deterministic, usesFailureRate)
+failureModels = {}
+
+# Patterns of deterministic models: (name, blockSize, failureRate) -> pattern
+patternCache = {}
+
+def failureModel(name, deterministic = True, usesFailureRate = True):
+    """Decorator registering a failure model generator under a name.
+
+        A generator takes (blockSize, failureRate, rng) and returns a
+        blockSize x blockSize boolean array of the segments released by the
+        proposer. Patterns of deterministic models are cached, so the
+        generator must not use rng. Shapes of models not using failureRate
+        are simulated once for all rates (see Planner). New models can be
+        registered from a configuration file and then used in failureModels.
+    """
+    def register(generator):
+        failureModels[name] = (generator, deterministic, usesFailureRate)
+        return generator
+    return register
+
+def failurePattern(name, blockSize, failureRate, rng):
+    """It returns the released segments of a block as a (frozen) bitarray.
+
+        Segments are in row-major order, as in Block.data.
+    """
+    generator, deterministic, usesFailureRate = failureModels[name]
+    key = (name, blockSize, failureRate if usesFailureRate else None)
+    if deterministic and key in patternCache:
+        return patternCache[key]
+    released = generator(blockSize, failureRate, rng)
+    pattern = bitarray()
+    pattern.frombytes(np.packbits(released, axis=None).tobytes())
+    del pattern[blockSize*blockSize:]
+    pattern = frozenbitarray(pattern)
+    if deterministic:
+        patternCache[key] = pattern
+    return pattern
+
+def releasedCount(blockSize, failureRate):
+    """It returns the number of segments released with a given failure rate."""
+    return int((1 - failureRate/100) * blockSize * blockSize)
+
+def grid(blockSize):
+    """It returns the row and column indices of a block, as broadcastable arrays."""
+    return np.arange(blockSize)[:, None], np.arange(blockSize)[None, :]
+
+@failureModel("random", deterministic=False)
+def randomFailures(blockSize, failureRate, rng):
+    """Segments are released uniformly at random."""
+    released = np.zeros(blockSize * blockSize, dtype=bool)
+    released[rng.permutation(blockSize * blockSize)[:releasedCount(blockSize, failureRate)]] = True
+    return released.reshape(blockSize, blockSize)
+
+@failureModel("sequential")
+def sequentialFailures(blockSize, failureRate, rng):
+    """The first segments in row-major order are released."""
+    released = np.arange(blockSize * blockSize) < releasedCount(blockSize, failureRate)
+    return released.reshape(blockSize, blockSize)
+
+@failureModel("MEP", usesFailureRate=False)
+def minimalErasurePattern(blockSize, failureRate, rng):
+    """Minimal size non-recoverable Erasure Pattern."""
+    r, c = grid(blockSize)
+    k = blockSize/2
+    return (r > k) | (c > k)
+
+@failureModel("MEP+1", usesFailureRate=False)
+def minimalErasurePatternPlusOne(blockSize, failureRate, rng):
+    """MEP +1 segment to make it recoverable."""
+    released = minimalErasurePattern(blockSize, failureRate, rng)
+    released[0, 0] = True
+    return released
+
+@failureModel("DEP", usesFailureRate=False)
+def diagonalErasurePattern(blockSize, failureRate, rng):
+    """Diagonal Erasure Pattern."""
+    r, c = grid(blockSize)
+    k = blockSize/2
+    return (r + c) % blockSize > k
+
+@failureModel("DEP+1", usesFailureRate=False)
+def diagonalErasurePatternPlusOne(blockSize, failureRate, rng):
+    """DEP +1 segment."""
+    released = diagonalErasurePattern(blockSize, failureRate, rng)
+    released[0, 0] = True
+    return released
+
+@failureModel("MREP", usesFailureRate=False)
+def minimalRecoverableErasurePattern(blockSize, failureRate, rng):
+    """Minimum size Recoverable Erasure Pattern."""
+    r, c = grid(blockSize)
+    k = blockSize/2
+    return (r < k) & (c < k)
+
+@failureModel("MREP-1", usesFailureRate=False)
+def minimalRecoverableErasurePatternMinusOne(blockSize, failureRate, rng):
+    """MREP -1 segment to make it non-recoverable."""
+    released = minimalRecoverableErasurePattern(blockSize, failureRate, rng)
+    released[0, 0] = False
+    return released
@@ -0,0 +1,120 @@
+#!/bin/python3
+
+import os
+import resource
+import concurrent.futures
+import numpy as np
+from joblib.externals.loky import get_reusable_executor
+from DAS.cost import CostModel
+
+def readStatus(field):
+    """It returns a memory field of /proc/self/status in MB, or None if not available."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def currentRSS():
+    """It returns the resident memory of the process in MB."""
+    rss = readStatus("VmRSS")
+    return rss if rss is not None else peakRSS()
+
+def peakRSS():
+    """It returns the peak resident memory of the process in MB, since the last resetPeakRSS."""
+    peak = readStatus("VmHWM")
+    if peak is None:
+        # lifetime peak, in kB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return peak
+
+def resetPeakRSS():
+    """It resets the peak resident memory of the process to the current one (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def numberWorkers(numJobs):
+    """It returns the number of workers of a joblib numJobs setting (-1 for all cores, etc.)."""
+    if numJobs > 0:
+        return numJobs
+    return max(os.cpu_count() + 1 + numJobs, 1)
+
+
+class MemoryModel(CostModel):
+    """This class estimates the memory used by the simulation of a shape, in MB.
+
+    It is fit on the memory recorded in past results, i.e. the peak resident
+    memory of the worker during the shape minus its resident memory before.
+    The prior, used as is until memory has been recorded, is two blocks per
+    node (numberNodes x 2 bitarrays of blockSize^2 bits) plus a fixed
+    overhead for the rest of the simulation (links, queues, topology).
+    """
+
+    target = "memory"
+    overhead = 32 # MB per shape, besides the blocks
+
+    def prior(self, logs):
+        """It returns the log prior memory from log numberNodes, blockSize and custody lines."""
+        numberNodes, blockSize = np.exp(logs[:2])
+        return np.log(numberNodes * 2 * blockSize**2 / 8 / 2**20 + self.overhead)
+
+
+class AdmissionScheduler:
+    """This class runs shapes in parallel while their predicted memory fits a budget.
+
+    Shapes are considered in the given order (e.g. longest first). A shape is
+    started when a worker is free and its predicted memory, plus that of the
+    running shapes and the baseline of each worker, fits in the budget.
+    Smaller shapes further in the order are started around the big ones
+    (backfilling), but once the first pending shape has been passed over
+    patience times, the freed memory is kept for it until it starts, so that
+    backfilling cannot starve it. A shape larger than the budget runs alone.
+    """
+
+    def __init__(self, workers, budget, baseline = 0, patience = None):
+        """It sets the number of workers, the memory budget, the per-worker baseline (MB) and the patience."""
+        self.workers = workers
+        self.budget = budget
+        self.baseline = baseline
+        self.patience = workers if patience is None else patience
+
+    def fits(self, memory, running):
+        """It checks whether a shape of the given memory can start along the running ones."""
+        if not running:
+            return True
+        used = sum(running.values()) + self.baseline * (len(running) + 1)
+        return len(running) < self.workers and used + memory <= self.budget
+
+    def run(self, function, tasks, memories):
+        """It runs function(*task) for each task, and returns the results in the order of tasks."""
+        executor = get_reusable_executor(max_workers=self.workers)
+        results = [None] * len(tasks)
+        pending = list(range(len(tasks)))
+        running = {}
+        futures = {}
+        skipped = 0 # times the first pending task was passed over by a later one
+        while pending or running:
+            for i in list(pending):
+                if i != pending[0] and skipped >= self.patience:
+                    break
+                if self.fits(memories[i], running):
+                    futures[executor.submit(function, *tasks[i])] = i
+                    running[i] = memories[i]
+                    if i == pending[0]:
+                        skipped = 0
+                    else:
+                        skipped += 1
+                    pending.remove(i)
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                i = futures.pop(future)
+                del running[i]
+                results[i] = future.result()
+        return results
@@ -0,0 +1,39 @@
+#!/bin/python3
+
+import numpy as np
+
+class MetricsRecorder:
+    """This class records per-step metrics in preallocated typed columns.
+
+    Each metric is a NumPy column that doubles in size when full, so that
+    appending a step is O(1) amortized. Columns are exported as views of
+    the recorded steps, without copying.
+    """
+
+    def __init__(self, names, dtypes = None, capacity = 64):
+        """It allocates one column per metric name (float64 unless specified)."""
+        self.names = list(names)
+        if dtypes is None:
+            dtypes = [np.float64] * len(self.names)
+        self.columns = [np.zeros(capacity, dtype=dtype) for dtype in dtypes]
+        self.size = 0
+
+    def __len__(self):
+        """It returns the number of recorded steps."""
+        return self.size
+
+    def append(self, *values):
+        """It records the values of a step, in the order of the column names."""
+        if self.size == len(self.columns[0]):
+            self.columns = [np.concatenate((column, np.zeros_like(column))) for column in self.columns]
+        for column, value in zip(self.columns, values):
+            column[self.size] = value
+        self.size += 1
+
+    def column(self, name):
+        """It returns the recorded steps of a metric."""
+        return self.columns[self.names.index(name)][:self.size]
+
+    def toArrays(self):
+        """It returns all the metrics as a dictionary of NumPy arrays."""
+        return {name: column[:self.size] for name, column in zip(self.names, self.columns)}
@@ -1,7 +1,7 @@
 #!/bin/python3
 
-import numpy as np
 from DAS.block import *
+from DAS.traffic import *
 
 class Observer:
     """This class gathers global data from the simulation, like an 'all-seen god'."""
@@ -15,6 +15,8 @@ class Observer:
         self.rows = [0] * self.config.blockSize
         self.columns = [0] * self.config.blockSize
         self.broadcasted = Block(self.config.blockSize)
+        self.traffic = None
+        self.trafficRecorder = None
 
 
     def checkRowsColumns(self, validators):
@@ -41,15 +43,19 @@ class Observer:
             self.logger.debug("There are %d missing samples in the network" % zeros, extra=self.format)
         return zeros
 
+    def getSegmentReplication(self, store):
+        """It returns how many nodes, besides the proposer, have each segment of the block."""
+        return store.segmentHolders(slice(1, None))
+
     def checkStatus(self, validators):
-        """It checks the status of how many expected and arrived samples globally."""
+        """It checks the status of how many expected and arrived samples globally, over the nodes online."""
         arrived = 0
         expected = 0
         ready = 0
         validatedall = 0
         validated = 0
         for val in validators:
-            if val.amIproposer == 0:
+            if val.amIproposer == 0 and not val.stopped:
                 (a, e, v) = val.checkStatus()
                 arrived += a
                 expected += e
@@ -62,6 +68,7 @@ class Observer:
     def getProgress(self, validators):
             """Calculate current simulation progress with different metrics.
 
+            Nodes offline (see Simulator.stopNodes) are not counted.
             Returns:
             - missingSamples: overall number of sample instances missing in nodes.
             Sample are counted on both rows and columns, so intersections of interest are counted twice.
@@ -74,29 +81,23 @@ class Observer:
             arrived, expected, ready, validatedall, validated = self.checkStatus(validators)
             missingSamples = expected - arrived
             sampleProgress = arrived / expected
-            nodeProgress = ready / (len(validators)-1)
-            validatorCnt = sum([v.vpn for v in validators[1:]])
+            online = [v for v in validators[1:] if not v.stopped]
+            nodeProgress = ready / len(online)
+            validatorCnt = sum([v.vpn for v in online])
             validatorAllProgress = validatedall / validatorCnt
             validatorProgress = validated / validatorCnt
 
             return missingSamples, sampleProgress, nodeProgress, validatorAllProgress, validatorProgress
 
-    def getTrafficStats(self, validators):
-            """Summary statistics of traffic measurements in a timestep."""
-            def maxOrNan(l):
-                return np.max(l) if l else np.NaN
-            def meanOrNan(l):
-                return np.mean(l) if l else np.NaN
+    def initTraffic(self, validators):
+        """It allocates the traffic counters for the given validators."""
+        self.traffic = TrafficCounters([v.nodeClass for v in validators])
+        self.trafficRecorder = TrafficRecorder(self.traffic)
 
-            trafficStats = {}
-            for cl in range(0,3):
-                Tx = [v.statsTxInSlot for v in validators if v.nodeClass == cl]
-                Rx = [v.statsRxInSlot for v in validators if v.nodeClass == cl]
-                RxDup = [v.statsRxDupInSlot for v in validators if v.nodeClass == cl]
-                trafficStats[cl] = {
-                    "Tx": {"mean": meanOrNan(Tx), "max": maxOrNan(Tx)},
-                    "Rx": {"mean": meanOrNan(Rx), "max": maxOrNan(Rx)},
-                    "RxDup": {"mean": meanOrNan(RxDup), "max": maxOrNan(RxDup)},
-                    }
+    def getTrafficStats(self):
+            """Summary statistics of traffic measurements in a timestep."""
+            return self.traffic.getStats()
 
-            return trafficStats
+    def getTrafficDistribution(self):
+            """Percentiles of per-node per-step traffic over the whole run, and per-node peaks."""
+            return self.trafficRecorder.getDistribution(), self.trafficRecorder.getPeaks()
@@ -0,0 +1,66 @@
+#!/bin/python3
+
+import copy
+from DAS.failures import failureModels
+
+class Planner:
+    """This class plans the simulations of a sweep, running equivalent shapes only once.
+
+    Two shapes are equivalent if they only differ by parameters that do not
+    affect the simulation: the class 2 parameters (vpn2, bwUplink2) when all
+    nodes are of class 1, the class 1 parameters (vpn1, bwUplink1) when all
+    nodes are of class 2, and failureRate with failure models that do not
+    use it. The first shape of each equivalence class is simulated, and its
+    results are copied to the others (the aliases).
+    """
+
+    def __init__(self, shapes):
+        """It groups the shapes by equivalence class, keeping their order."""
+        self.shapes = list(shapes)
+        self.groups = {}
+        for shape in self.shapes:
+            self.groups.setdefault(self.canonicalKey(shape), []).append(shape)
+
+    @staticmethod
+    def canonicalKey(shape):
+        """It returns the parameters of a shape that matter for the simulation (None otherwise)."""
+        params = dict(shape.__dict__)
+        params.pop("randomSeed", None)
+        if shape.class1ratio == 1.0:
+            params["vpn2"] = params["bwUplink2"] = None
+        elif shape.class1ratio == 0.0:
+            params["vpn1"] = params["bwUplink1"] = None
+        model = failureModels.get(shape.failureModel)
+        if model and not model[2]:
+            params["failureRate"] = None
+        return tuple(sorted(params.items()))
+
+    def nextShape(self):
+        """It yields the shapes to simulate, one per equivalence class."""
+        for group in self.groups.values():
+            yield group[0]
+
+    def fanOut(self, results):
+        """It maps the results of the simulated shapes back to all the shapes.
+
+            Results are given in the order of nextShape, as a list of results
+            (one per block) per simulated shape. Aliases get copies of the
+            results of their equivalence class, with their own shape, and
+            aliasOf set to the simulated result.
+            Returns: the list of results of all the shapes, in sweep order.
+        """
+        byShape = {}
+        for group, shapeResults in zip(self.groups.values(), results):
+            byShape[id(group[0])] = shapeResults
+            for shape in group[1:]:
+                byShape[id(shape)] = [self.alias(result, shape) for result in shapeResults]
+        return [result for shape in self.shapes for result in byShape[id(shape)]]
+
+    @staticmethod
+    def alias(result, shape):
+        """It returns a copy of a result for an equivalent shape, which gets the seed of the simulated one."""
+        shape.setSeed(result.shape.randomSeed)
+        alias = copy.copy(result)
+        alias.shape = shape
+        alias.aliasOf = result.label()
+        return alias
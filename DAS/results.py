@@ -2,20 +2,40 @@
 
 import os
 import bisect
+import numpy as np
 from xml.dom import minidom
 from dicttoxml import dicttoxml
 
+def toSerializable(value):
+    """It converts NumPy arrays and scalars (possibly nested) to Python types."""
+    if isinstance(value, dict):
+        return {k: toSerializable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [toSerializable(v) for v in value]
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return value
+
 class Result:
     """This class stores and process/store the results of a simulation."""
 
-    def __init__(self, shape, execID):
-        """It initializes the instance with a specific shape."""
+    def __init__(self, shape, execID, blockID = None):
+        """It initializes the instance with a specific shape (and block, in multi-block runs)."""
         self.shape = shape
         self.execID = execID
+        self.blockID = blockID
+        self.runTime = -1 # wall time of the simulation of the shape, in seconds
+        self.memory = -1 # peak resident memory added by the simulation of the shape, in MB
+        self.aliasOf = None # label of the simulated result, if copied from an equivalent shape
+        self.surrogate = False # True if predicted by the surrogate (see DAS/surrogate.py), not simulated
+        self.recoverable = -1 # 1 if the peeling decoder repairs the initial block, 0 if not
+        self.repairRounds = -1 # row and column passes the peeling decoder needs to repair the initial block
         self.blockAvailable = -1
         self.tta = -1
         self.missingVector = []
         self.metrics = {}
+        self.samplingSuccess = -1
+        self.samplingTTA = -1
 
     def populate(self, shape, config, missingVector):
         """It populates part of the result data inside a vector."""
@@ -30,23 +50,43 @@ class Result:
             self.blockAvailable = 0
             self.tta = -1
 
+    def populateSampling(self, config, progress):
+        """It populates the sampling results from the ratio of nodes done after each step.
+
+            The sampling TTA is counted from the end of dispersal, including
+            the step of the first requests.
+        """
+        self.samplingSuccess = progress[-1] if progress else 0
+        tta = bisect.bisect(progress, config.successCondition)
+        if self.samplingSuccess >= config.successCondition:
+            self.samplingTTA = (tta + 1) * (config.stepDuration)
+        else:
+            self.samplingTTA = -1
+
     def addMetric(self, name, metric):
         """Generic function to add a metric to the results."""
         self.metrics[name] = metric
 
+    def label(self):
+        """It returns the name of the result, based on the shape and block."""
+        if self.blockID is None:
+            return str(self.shape)
+        return str(self.shape)+"-b-"+str(self.blockID)
+
     def dump(self):
-        """It dumps the results of the simulation in an XML file."""
-        if not os.path.exists("results"):
-            os.makedirs("results")
-        if not os.path.exists("results/"+self.execID):
-            os.makedirs("results/"+self.execID)
+        """It dumps the results of the simulation in an XML file (surrogate results in their own folder)."""
+        folder = "results/"+self.execID
+        if self.surrogate:
+            folder += "/surrogate"
+        if not os.path.exists(folder):
+            os.makedirs(folder)
         resd1 = self.shape.__dict__
         resd2 = self.__dict__.copy()
         resd2.pop("shape")
-        resd1.update(resd2)
+        resd1.update(toSerializable(resd2))
         resXml = dicttoxml(resd1)
         xmlstr = minidom.parseString(resXml)
         xmlPretty = xmlstr.toprettyxml()
-        filePath = "results/"+self.execID+"/"+str(self.shape)+".xml"
+        filePath = folder+"/"+self.label()+".xml"
         with open(filePath, "w") as f:
             f.write(xmlPretty)
@@ -0,0 +1,122 @@
+#!/bin/python3
+
+import numpy as np
+
+class SamplingEngine:
+    """This class simulates the random sampling phase that follows dispersal.
+
+    Every node (except the proposer) draws numberSamples random segments of the
+    block. At each step, each sample that is still missing is requested from a
+    random custodian of its row or column, and it succeeds if that custodian
+    holds the segment. All draws and checks of a step are done in bulk for all
+    nodes, against the state of the network at the end of dispersal.
+    """
+
+    def __init__(self, validators, shape, config, rng, store = None):
+        """It indexes the custodians of each line and draws the samples of all nodes."""
+        self.shape = shape
+        self.config = config
+        self.rng = rng
+        self.store = store
+        bs = self.shape.blockSize
+        if self.config.numberSamples > bs * bs:
+            # samples are distinct segments, see dedupSamples
+            raise ValueError("numberSamples (%d) is larger than the number of segments (%d)" % (self.config.numberSamples, bs * bs))
+        self.nodes = np.array([v.ID for v in validators if not v.amIproposer], dtype=np.int64)
+
+        # custodians of each line, in CSR form (ptr[line]:ptr[line+1] in ids)
+        self.rowPtr, self.rowNodes, self.rowBits = self.indexCustodians(validators, 0)
+        self.columnPtr, self.columnNodes, self.columnBits = self.indexCustodians(validators, 1)
+
+        self.rows = self.rng.integers(0, bs, size=(len(self.nodes), self.config.numberSamples))
+        self.columns = self.rng.integers(0, bs, size=(len(self.nodes), self.config.numberSamples))
+        self.dedupSamples()
+        self.done = np.zeros(self.rows.shape, dtype=bool)
+        self.completion = np.full(len(self.nodes), -1, dtype=np.int64)
+
+    def indexCustodians(self, validators, dim):
+        """It returns the custodians of each row (dim 0) or column (dim 1).
+
+            Without a block store, the lines held by each custodian at the
+            end of dispersal are also copied, packed, in custody order.
+        """
+        bs = self.shape.blockSize
+        custodians = [[] for i in range(bs)]
+        lines = [[] for i in range(bs)]
+        for v in validators:
+            if v.amIproposer:
+                continue
+            for id in (v.columnIDs if dim else v.rowIDs):
+                custodians[id].append(v.ID)
+                if self.store is None:
+                    lines[id].append((v.getColumn(id) if dim else v.getRow(id)).tobytes())
+        ptr = np.zeros(bs + 1, dtype=np.int64)
+        ptr[1:] = np.cumsum([len(c) for c in custodians])
+        ids = np.array([id for c in custodians for id in c], dtype=np.int64)
+        bits = None
+        if self.store is None:
+            bits = np.frombuffer(b"".join(l for line in lines for l in line), dtype=np.uint8).reshape(len(ids), (bs + 7) // 8)
+        return ptr, ids, bits
+
+    def dedupSamples(self):
+        """It redraws repeated samples of a node until all are distinct."""
+        bs = self.shape.blockSize
+        while True:
+            segments = self.rows * bs + self.columns
+            order = np.argsort(segments, axis=1)
+            ordered = np.take_along_axis(segments, order, axis=1)
+            repeated = np.zeros(segments.shape, dtype=bool)
+            np.put_along_axis(repeated, order[:, 1:], ordered[:, 1:] == ordered[:, :-1], axis=1)
+            count = repeated.sum()
+            if not count:
+                return
+            self.rows[repeated] = self.rng.integers(0, bs, size=count)
+            self.columns[repeated] = self.rng.integers(0, bs, size=count)
+
+    def hasSegments(self, byRow, entries, rows, columns):
+        """It checks whether the custody entries (of rows if byRow, else of columns) hold the given segments."""
+        bs = self.shape.blockSize
+        byColumn = ~byRow
+        if self.store is not None:
+            nodes = np.empty(len(entries), dtype=np.int64)
+            nodes[byRow] = self.rowNodes[entries[byRow]]
+            nodes[byColumn] = self.columnNodes[entries[byColumn]]
+            bit = rows * bs + columns
+            octets = self.store.array[nodes, bit >> 3]
+        else:
+            bit = np.where(byRow, columns, rows)
+            octets = np.empty(len(entries), dtype=np.uint8)
+            octets[byRow] = self.rowBits[entries[byRow], bit[byRow] >> 3]
+            octets[byColumn] = self.columnBits[entries[byColumn], bit[byColumn] >> 3]
+        return (octets >> (7 - (bit & 7))) & 1 == 1
+
+    def step(self, step):
+        """It requests all missing samples from random custodians."""
+        pending = np.nonzero(~self.done)
+        rows = self.rows[pending]
+        columns = self.columns[pending]
+        nRow = self.rowPtr[rows + 1] - self.rowPtr[rows]
+        nColumn = self.columnPtr[columns + 1] - self.columnPtr[columns]
+        total = nRow + nColumn
+        pick = np.floor(self.rng.random(len(rows)) * total).astype(np.int64)
+        byRow = pick < nRow
+        entries = np.where(byRow, self.rowPtr[rows] + pick, self.columnPtr[columns] + pick - nRow)
+        served = total > 0
+        found = np.zeros(len(rows), dtype=bool)
+        found[served] = self.hasSegments(byRow[served], entries[served], rows[served], columns[served])
+        self.done[pending[0][found], pending[1][found]] = True
+        complete = (self.completion < 0) & self.done.all(axis=1)
+        self.completion[complete] = step
+
+    def run(self):
+        """It runs the sampling phase for at most samplingSteps steps.
+
+            Returns: the fraction of nodes done sampling after each step.
+        """
+        progress = []
+        for step in range(self.config.samplingSteps):
+            self.step(step)
+            progress.append((self.completion >= 0).mean())
+            if progress[-1] == 1:
+                break
+        return progress
@@ -1,18 +1,39 @@
 #!/bin/python
 
 import networkx as nx
-import logging, random
-import pandas as pd
+import numpy as np
+import logging, os
+import pickle, zlib
+from itertools import chain
+from joblib import Parallel, delayed
 from functools import partial, partialmethod
 from datetime import datetime
 from DAS.tools import *
 from DAS.results import *
 from DAS.observer import *
+from DAS.metrics import *
+from DAS.sampling import *
+from DAS.streams import *
+from DAS.trace import *
 from DAS.validator import *
 
 class Simulator:
     """This class implements the main DAS simulator."""
 
+    # Columns of the progress metric, recorded at each step
+    progressMetrics = [
+        "samples received",
+        "nodes ready",
+        "validators ready",
+        "TX builder mean",
+        "TX class1 mean",
+        "TX class2 mean",
+        "RX class1 mean",
+        "RX class2 mean",
+        "Dup class1 mean",
+        "Dup class2 mean",
+        ]
+
     def __init__(self, shape, config, execID):
         """It initializes the simulation with a set of parameters (shape)."""
         self.shape = shape
@@ -30,6 +51,18 @@ class Simulator:
         self.distC = []
         self.nodeRows = []
         self.nodeColumns = []
+        self.rowAssignment = None
+        self.columnAssignment = None
+        self.store = None
+        self.trace = None
+        self.maxDelay = 0
+        self.stepCallback = None # called with the number of steps done, after each step
+        # state of the run loop, kept in the simulator so that runs can be paused and resumed
+        self.steps = 0
+        self.missingVector = None
+        self.progress = None
+        self.maxReady = 1 # highest ratio of validators that can be ready, see checkRecoverable
+        self.streams = RandomStreams(self.shape.randomSeed)
 
         # In GossipSub the initiator might push messages without participating in the mesh.
         # proposerPublishOnly regulates this behavior. If set to true, the proposer is not
@@ -43,10 +76,79 @@ class Simulator:
         # self.shape.netDegree: default behavior similar (but not same) to previous code
         self.proposerPublishTo = self.shape.netDegree
 
+    def __getstate__(self):
+        """It returns the simulation state for snapshots, without config, logger, callback and trace."""
+        state = self.__dict__.copy()
+        for field in ["config", "logger", "stepCallback", "trace"]:
+            state[field] = None
+        return state
+
+    def __setstate__(self, state):
+        """It restores a simulation state, linking the neighbors back to their nodes."""
+        self.__dict__.update(state)
+        for v in self.validators:
+            for neighs in chain(v.rowNeighbors.values(), v.columnNeighbors.values()):
+                for neigh in neighs.values():
+                    neigh.node = self.validators[neigh.node]
+
+    def snapshot(self):
+        """It returns the state of the simulation (nodes, links, queues, random streams), serialised and compressed.
+
+            The configuration is not included, see restore.
+        """
+        return zlib.compress(pickle.dumps(self, pickle.HIGHEST_PROTOCOL), 1)
+
+    @classmethod
+    def restore(cls, data, config):
+        """It returns a copy of a simulation from a snapshot, with the given configuration.
+
+            The copy keeps its blocks in memory, and it is not traced.
+        """
+        sim = pickle.loads(zlib.decompress(data))
+        sim.config = config
+        sim.initLogger()
+        if sim.store:
+            # blocks were unpickled as copies, they are views on the store again
+            sim.store.path = None
+            sim.store.array = np.array(sim.store.array)
+            for v in sim.validators:
+                v.block = sim.store.getBlock(v.ID)
+        return sim
+
+    def stopNodes(self, nodeIDs):
+        """It takes nodes offline: they stop sending, receiving and repairing.
+
+            Segments sent to them are lost, and they no longer count in the
+            progress of the block (samples, nodes and validators ready).
+        """
+        for i in nodeIDs:
+            self.validators[i].stopped = True
+
+    def whatIf(self, variants, numJobs = 1):
+        """It runs variants of the simulation from its current state, in parallel.
+
+            Each variant is a function called with a restored copy of the
+            simulator before it runs to the end, e.g. to stop nodes at the
+            current step. The simulation itself is not modified.
+            Returns: the results of the variants, in order.
+        """
+        data = self.snapshot()
+        return Parallel(numJobs)(delayed(runVariant)(data, self.config, variant) for variant in variants)
+
     def initValidators(self):
         """It initializes all the validators in the network."""
         self.glob = Observer(self.logger, self.shape)
         self.validators = []
+        if not self.config.sparseBlocks and self.config.numberBlocks == 1 and BlockStore.fits(self.shape.blockSize):
+            path = None
+            if self.config.mmapBlockStore:
+                os.makedirs("results/"+self.execID, exist_ok=True)
+                path = "results/"+self.execID+"/blocks-"+str(self.shape)+".npy"
+            self.store = BlockStore(self.shape.blockSize, self.shape.numberNodes, path)
+        if self.config.traceEvents:
+            os.makedirs("results/"+self.execID, exist_ok=True)
+            path = "results/"+self.execID+"/trace-"+str(self.shape)+".trace"
+            self.trace = TraceWriter(path, self.shape.blockSize, self.shape.numberNodes)
         if self.config.evenLineDistribution:
 
             lightNodes = int(self.shape.numberNodes * self.shape.class1ratio)
@@ -55,54 +157,64 @@ class Simulator:
             heavyVal = heavyNodes * self.shape.vpn2
             totalValidators = lightVal + heavyVal
             totalRows = totalValidators * self.shape.chi
-            rows =    list(range(self.shape.blockSize)) * (int(totalRows/self.shape.blockSize)+1)
-            columns = list(range(self.shape.blockSize)) * (int(totalRows/self.shape.blockSize)+1)
-            rows =    rows[0:totalRows]
-            columns = columns[0:totalRows]
-            random.shuffle(rows)
-            random.shuffle(columns)
-            offset = lightVal*self.shape.chi
-            self.logger.debug("There is a total of %d nodes, %d light and %d heavy." % (self.shape.numberNodes, lightNodes, heavyNodes), extra=self.format)
-            self.logger.debug("There is a total of %d validators, %d in light nodes and %d in heavy nodes" % (totalValidators, lightVal, heavyVal), extra=self.format)
-            self.logger.debug("Shuffling a total of %d rows/columns to be assigned (X=%d)" % (len(rows), self.shape.chi), extra=self.format)
-            self.logger.debug("Shuffled rows: %s" % str(rows), extra=self.format)
-            self.logger.debug("Shuffled columns: %s" % str(columns), extra=self.format)
-
-        assignedRows = []
-        assignedCols = []
+            # Each line is used the same number of times (+-1), then lines are
+            # shuffled into a (validators x chi) matrix, light nodes first.
+            rng = self.streams.generator("assignment")
+            lines = np.tile(np.arange(self.shape.blockSize), totalRows // self.shape.blockSize + 1)[:totalRows]
+            self.rowAssignment = rng.permutation(lines).reshape(totalValidators, self.shape.chi)
+            self.columnAssignment = rng.permutation(lines).reshape(totalValidators, self.shape.chi)
+            nodeVpn = np.where(np.arange(self.shape.numberNodes) < lightNodes, self.shape.vpn1, self.shape.vpn2)
+            firstValidator = np.concatenate(([0], np.cumsum(nodeVpn)))
+            self.logger.debug("There is a total of %d nodes, %d light and %d heavy.", self.shape.numberNodes, lightNodes, heavyNodes, extra=self.format)
+            self.logger.debug("There is a total of %d validators, %d in light nodes and %d in heavy nodes", totalValidators, lightVal, heavyVal, extra=self.format)
+            self.logger.debug("Shuffling a total of %d rows/columns to be assigned (X=%d)", totalRows, self.shape.chi, extra=self.format)
+            self.logger.debug("Shuffled rows: %s", self.rowAssignment, extra=self.format)
+            self.logger.debug("Shuffled columns: %s", self.columnAssignment, extra=self.format)
+
         for i in range(self.shape.numberNodes):
             if self.config.evenLineDistribution:
-                if i < int(lightVal/self.shape.vpn1):  # First start with the light nodes
-                    start =   i  *self.shape.chi*self.shape.vpn1
-                    end   = (i+1)*self.shape.chi*self.shape.vpn1
-                else:
-                    j = i - int(lightVal/self.shape.vpn1)
-                    start = offset+(  j  *self.shape.chi*self.shape.vpn2)
-                    end   = offset+((j+1)*self.shape.chi*self.shape.vpn2)
-                r = rows[start:end]
-                c = columns[start:end]
-                val = Validator(i, int(not i!=0), self.logger, self.shape, self.config, r, c)
-                self.logger.debug("Node %d has row IDs: %s" % (val.ID, val.rowIDs), extra=self.format)
-                self.logger.debug("Node %d has column IDs: %s" % (val.ID, val.columnIDs), extra=self.format)
-                assignedRows = assignedRows + list(r)
-                assignedCols = assignedCols + list(c)
+                r = self.rowAssignment[firstValidator[i]:firstValidator[i+1]]
+                c = self.columnAssignment[firstValidator[i]:firstValidator[i+1]]
+                val = Validator(i, int(not i!=0), self.logger, self.shape, self.config, r, c, self.store, self.streams)
+                self.logger.debug("Node %d has row IDs: %s", val.ID, val.rowIDs, extra=self.format)
+                self.logger.debug("Node %d has column IDs: %s", val.ID, val.columnIDs, extra=self.format)
                 self.nodeRows.append(val.rowIDs)
                 self.nodeColumns.append(val.columnIDs)
 
             else:
-                val = Validator(i, int(not i!=0), self.logger, self.shape, self.config)
+                val = Validator(i, int(not i!=0), self.logger, self.shape, self.config, store=self.store, streams=self.streams)
+            val.trace = self.trace
             if i == self.proposerID:
                 val.initBlock()
             else:
                 val.logIDs()
             self.validators.append(val)
 
-        assignedRows.sort()
-        assignedCols.sort()
-        self.logger.debug("Rows assigned: %s" % str(assignedRows), extra=self.format)
-        self.logger.debug("Columns assigned: %s" % str(assignedCols), extra=self.format)
+        self.glob.initTraffic(self.validators)
+        for val in self.validators:
+            val.traffic = self.glob.traffic
+        if self.config.evenLineDistribution and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Rows assigned: %s", np.sort(self.rowAssignment, axis=None), extra=self.format)
+            self.logger.debug("Columns assigned: %s", np.sort(self.columnAssignment, axis=None), extra=self.format)
         self.logger.debug("Validators initialized.", extra=self.format)
 
+    def linkDelays(self, count, rng):
+        """It draws the delay in steps of count links from the linkLatency distribution."""
+        model, *params = self.config.linkLatency
+        if model == "constant":
+            latency = np.full(count, params[0])
+        elif model == "uniform":
+            latency = rng.uniform(params[0], params[1], count)
+        elif model == "normal":
+            latency = np.maximum(rng.normal(params[0], params[1], count), 0)
+        else:
+            self.logger.error("Unknown latency model %s" % model, extra=self.format)
+            latency = np.zeros(count)
+        delays = (latency // self.config.stepDuration).astype(np.int64)
+        if count:
+            self.maxDelay = max(self.maxDelay, int(delays.max()))
+        return delays.tolist()
+
     def initNetwork(self):
         """It initializes the simulated network."""
         rowChannels = [[] for i in range(self.shape.blockSize)]
@@ -134,14 +246,15 @@ class Simulator:
                 self.logger.debug("Graph fully connected with degree %d !" % (len(rowChannels[id]) - 1), extra=self.format)
                 G = nx.complete_graph(len(rowChannels[id]))
             else:
-                G = nx.random_regular_graph(self.shape.netDegree, len(rowChannels[id]))
+                G = nx.random_regular_graph(self.shape.netDegree, len(rowChannels[id]), seed=self.streams.seed("rowTopology", id))
             if not nx.is_connected(G):
                 self.logger.error("Graph not connected for row %d !" % id, extra=self.format)
-            for u, v in G.edges:
+            delays = self.linkDelays(G.number_of_edges(), self.streams.generator("rowLatency", id))
+            for (u, v), delay in zip(G.edges, delays):
                 val1=rowChannels[id][u]
                 val2=rowChannels[id][v]
-                val1.rowNeighbors[id].update({val2.ID : Neighbor(val2, 0, self.shape.blockSize)})
-                val2.rowNeighbors[id].update({val1.ID : Neighbor(val1, 0, self.shape.blockSize)})
+                val1.rowNeighbors[id].update({val2.ID : Neighbor(val2, 0, self.shape.blockSize, delay)})
+                val2.rowNeighbors[id].update({val1.ID : Neighbor(val1, 0, self.shape.blockSize, delay)})
 
             if not columnChannels[id]:
                 self.logger.error("No nodes for column %d !" % id, extra=self.format)
@@ -150,27 +263,36 @@ class Simulator:
                 self.logger.debug("Graph fully connected with degree %d !" % (len(columnChannels[id]) - 1), extra=self.format)
                 G = nx.complete_graph(len(columnChannels[id]))
             else:
-                G = nx.random_regular_graph(self.shape.netDegree, len(columnChannels[id]))
+                G = nx.random_regular_graph(self.shape.netDegree, len(columnChannels[id]), seed=self.streams.seed("columnTopology", id))
             if not nx.is_connected(G):
                 self.logger.error("Graph not connected for column %d !" % id, extra=self.format)
-            for u, v in G.edges:
+            delays = self.linkDelays(G.number_of_edges(), self.streams.generator("columnLatency", id))
+            for (u, v), delay in zip(G.edges, delays):
                 val1=columnChannels[id][u]
                 val2=columnChannels[id][v]
-                val1.columnNeighbors[id].update({val2.ID : Neighbor(val2, 1, self.shape.blockSize)})
-                val2.columnNeighbors[id].update({val1.ID : Neighbor(val1, 1, self.shape.blockSize)})
+                val1.columnNeighbors[id].update({val2.ID : Neighbor(val2, 1, self.shape.blockSize, delay)})
+                val2.columnNeighbors[id].update({val1.ID : Neighbor(val1, 1, self.shape.blockSize, delay)})
 
         for v in self.validators:
             if (self.proposerPublishOnly and v.amIproposer):
+                rng = self.streams.generator("publish", v.ID)
+                latencyRng = self.streams.generator("publishLatency", v.ID)
                 for id in v.rowIDs:
                     count = min(self.proposerPublishTo, len(rowChannels[id]))
-                    publishTo = random.sample(rowChannels[id], count)
-                    for vi in publishTo:
-                        v.rowNeighbors[id].update({vi.ID : Neighbor(vi, 0, self.shape.blockSize)})
+                    publishTo = [rowChannels[id][i] for i in rng.choice(len(rowChannels[id]), count, replace=False)]
+                    for vi, delay in zip(publishTo, self.linkDelays(count, latencyRng)):
+                        v.rowNeighbors[id].update({vi.ID : Neighbor(vi, 0, self.shape.blockSize, delay)})
                 for id in v.columnIDs:
                     count = min(self.proposerPublishTo, len(columnChannels[id]))
-                    publishTo = random.sample(columnChannels[id], count)
-                    for vi in publishTo:
-                        v.columnNeighbors[id].update({vi.ID : Neighbor(vi, 1, self.shape.blockSize)})
+                    publishTo = [columnChannels[id][i] for i in rng.choice(len(columnChannels[id]), count, replace=False)]
+                    for vi, delay in zip(publishTo, self.linkDelays(count, latencyRng)):
+                        v.columnNeighbors[id].update({vi.ID : Neighbor(vi, 1, self.shape.blockSize, delay)})
+
+        for v in self.validators:
+            v.indexNeighbors()
+            v.initInbound(self.maxDelay)
+        if self.proposerPublishOnly and self.config.numberBlocks == 1:
+            self.validators[self.proposerID].planDispersal()
 
         if self.logger.isEnabledFor(logging.DEBUG):
             for i in range(0, self.shape.numberNodes):
@@ -195,9 +317,12 @@ class Simulator:
 
     def printDiagnostics(self):
         """Print all required diagnostics to check when a block does not become available"""
-        for val in self.validators:
-            (a, e) = val.checkStatus()
-            if e-a > 0 and val.ID != 0:
+        if self.store:
+            holders = self.glob.getSegmentReplication(self.store)
+            self.logger.warning("%d segments are not held by any node" % (holders == 0).sum(), extra=self.format)
+        for val in self.validators[1:]:
+            (a, e, v) = val.checkStatus()
+            if e-a > 0:
                 self.logger.warning("Node %d is missing %d samples" % (val.ID, e-a), extra=self.format)
                 for r in val.rowIDs:
                     row = val.getRow(r)
@@ -216,29 +341,110 @@ class Simulator:
                             self.logger.debug("Column %d, Neighbor %d sent: %s" % (c, val.columnNeighbors[c][nc].node.ID, val.columnNeighbors[c][nc].received), extra=self.format)
                             self.logger.debug("Column %d, Neighbor %d has: %s" % (c, val.columnNeighbors[c][nc].node.ID, self.validators[val.columnNeighbors[c][nc].node.ID].getColumn(c)), extra=self.format)
 
-    def run(self):
-        """It runs the main simulation until the block is available or it gets stucked."""
-        self.glob.checkRowsColumns(self.validators)
-        for i in range(0,self.shape.numberNodes):
-            if i == self.proposerID:
-                self.validators[i].initBlock()
-            else:
-                self.validators[i].logIDs()
-        arrived, expected, ready, validatedall, validated = self.glob.checkStatus(self.validators)
-        missingSamples = expected - arrived
-        missingVector = []
-        progressVector = []
-        trafficStatsVector = []
-        steps = 0
+    def recordProgress(self, steps, progress, trafficStats, *extra):
+        """It records the progress of the current block after a step.
+
+            Returns: the number of missing samples.
+        """
+        missingSamples, sampleProgress, nodeProgress, validatorAllProgress, validatorProgress = self.glob.getProgress(self.validators)
+        self.logger.debug("step %d, arrived %0.02f %%, ready %0.02f %%, validatedall %0.02f %%, , validated %0.02f %%"
+                          % (steps, sampleProgress*100, nodeProgress*100, validatorAllProgress*100, validatorProgress*100), extra=self.format)
+
+        progress.append(
+            sampleProgress,
+            nodeProgress,
+            validatorProgress,
+            trafficStats[0]["Tx"]["mean"],
+            trafficStats[1]["Tx"]["mean"],
+            trafficStats[2]["Tx"]["mean"],
+            trafficStats[1]["Rx"]["mean"],
+            trafficStats[2]["Rx"]["mean"],
+            trafficStats[1]["RxDup"]["mean"],
+            trafficStats[2]["RxDup"]["mean"],
+            *extra
+            )
+        return missingSamples
+
+    def isStalled(self, missingVector, blockID = 0):
+        """It checks whether a block made no progress during the last steps4StopCondition steps, with nothing in flight."""
+        if len(missingVector) <= self.config.steps4StopCondition:
+            return False
+        if missingVector[-1] != missingVector[-1-self.config.steps4StopCondition]:
+            return False
+        return not any(v.inFlight[blockID] for v in self.validators)
+
+    def checkRecoverable(self, result):
+        """It checks whether the initial block can be repaired, and records it in result.
+
+            The segments released by the proposer are peeled (see tools.peel):
+            the lines still incomplete at the end can never be complete in any
+            node, and the validators in custody of one of them never get ready.
+            Returns: the highest ratio of validators that can be ready.
+        """
+        data, rounds = peel(bitMatrix(self.validators[self.proposerID].block.data, self.shape.blockSize))
+        result.recoverable = int(data.all())
+        result.repairRounds = rounds if result.recoverable else -1
+        if result.recoverable:
+            return 1
+        completeLines = np.concatenate((data.all(axis=1), data.all(axis=0)))
+        validators = [v for v in self.validators if not v.amIproposer]
+        ready = sum(int(completeLines[v.requiredLines].all(axis=1).sum()) for v in validators)
+        return ready / sum(v.vpn for v in validators)
+
+    def finishBlock(self, result, progress, missingVector, blockID = 0):
+        """It runs the sampling phase on the current block and populates its result."""
+        if self.config.samplingPhase:
+            self.logger.debug("PHASE SAMPLING", extra=self.format)
+            rng = self.streams.generator("sampling", blockID=blockID)
+            sampling = SamplingEngine(self.validators, self.shape, self.config, rng, self.store)
+            samplingProgress = sampling.run()
+            result.populateSampling(self.config, samplingProgress)
+            if self.config.saveProgress:
+                result.addMetric("samplingProgress", samplingProgress)
+
+        if self.config.saveRCdist:
+            result.addMetric("rowDist", self.distR)
+            result.addMetric("columnDist", self.distC)
+        if self.config.saveProgress:
+            result.addMetric("progress", progress.toArrays())
+        result.populate(self.shape, self.config, missingVector)
+
+    def run(self, until = None):
+        """It runs the main simulation until the block is available or it gets stucked.
+
+            If until is given, the simulation pauses before step until and it
+            returns None. Calling run again, e.g. after taking a snapshot or on a
+            restored copy, continues it.
+        """
+        if self.progress is None:
+            self.glob.checkRowsColumns(self.validators)
+            for i in range(0,self.shape.numberNodes):
+                if i == self.proposerID:
+                    self.validators[i].initBlock()
+                else:
+                    self.validators[i].logIDs()
+            if self.trace:
+                self.trace.recordBlock(0, 0, self.proposerID, self.validators[self.proposerID].block.data)
+            self.maxReady = self.checkRecoverable(self.result)
+            if self.maxReady < self.config.successCondition:
+                self.logger.debug("At most %0.02f %% of the validators can be ready" % (self.maxReady*100), extra=self.format)
+            arrived, expected, ready, validatedall, validated = self.glob.checkStatus(self.validators)
+            missingSamples = expected - arrived
+            self.missingVector = [missingSamples]
+            self.progress = MetricsRecorder(self.progressMetrics)
+            self.steps = 0
+        missingVector = self.missingVector
+        progress = self.progress
         while(True):
-            missingVector.append(missingSamples)
-            oldMissingSamples = missingSamples
+            steps = self.steps
+            if until is not None and steps >= until:
+                return None
             self.logger.debug("PHASE SEND %d" % steps, extra=self.format)
             for i in range(0,self.shape.numberNodes):
-                self.validators[i].send()
+                self.validators[i].send(steps)
             self.logger.debug("PHASE RECEIVE %d" % steps, extra=self.format)
             for i in range(1,self.shape.numberNodes):
-                self.validators[i].receiveRowsColumns()
+                self.validators[i].receiveRowsColumns(steps)
             self.logger.debug("PHASE RESTORE %d" % steps, extra=self.format)
             for i in range(1,self.shape.numberNodes):
                 self.validators[i].restoreRows()
@@ -249,61 +455,131 @@ class Simulator:
                 self.validators[i].logColumns()
 
             # log TX and RX statistics
-            trafficStats = self.glob.getTrafficStats(self.validators)
-            self.logger.debug("step %d: %s" %
-                (steps, trafficStats), extra=self.format)
-            for i in range(0,self.shape.numberNodes):
-                self.validators[i].updateStats()
-            trafficStatsVector.append(trafficStats)
-
-            missingSamples, sampleProgress, nodeProgress, validatorAllProgress, validatorProgress = self.glob.getProgress(self.validators)
-            self.logger.debug("step %d, arrived %0.02f %%, ready %0.02f %%, validatedall %0.02f %%, , validated %0.02f %%"
-                              % (steps, sampleProgress*100, nodeProgress*100, validatorAllProgress*100, validatorProgress*100), extra=self.format)
-
-            cnS = "samples received"
-            cnN = "nodes ready"
-            cnV = "validators ready"
-            cnT0 = "TX builder mean"
-            cnT1 = "TX class1 mean"
-            cnT2 = "TX class2 mean"
-            cnR1 = "RX class1 mean"
-            cnR2 = "RX class2 mean"
-            cnD1 = "Dup class1 mean"
-            cnD2 = "Dup class2 mean"
-
-            progressVector.append({
-                cnS:sampleProgress,
-                cnN:nodeProgress,
-                cnV:validatorProgress,
-                cnT0: trafficStats[0]["Tx"]["mean"],
-                cnT1: trafficStats[1]["Tx"]["mean"],
-                cnT2: trafficStats[2]["Tx"]["mean"],
-                cnR1: trafficStats[1]["Rx"]["mean"],
-                cnR2: trafficStats[2]["Rx"]["mean"],
-                cnD1: trafficStats[1]["RxDup"]["mean"],
-                cnD2: trafficStats[2]["RxDup"]["mean"],
-                })
-
-            if missingSamples == oldMissingSamples:
-                if len(missingVector) > self.config.steps4StopCondition:
-                    if missingSamples == missingVector[-self.config.steps4StopCondition]:
-                        self.logger.debug("The block cannot be recovered, failure rate %d!" % self.shape.failureRate, extra=self.format)
-                        if self.config.diagnostics:
-                            self.printDiagnostics()
-                        break
-                missingVector.append(missingSamples)
-            elif missingSamples == 0:
+            trafficStats = self.glob.getTrafficStats()
+            self.glob.traffic.endStep()
+            self.logger.debug("step %d: %s", steps, trafficStats, extra=self.format)
+
+            missingSamples = self.recordProgress(steps, progress, trafficStats)
+            missingVector.append(missingSamples)
+            if missingSamples == 0:
                 self.logger.debug("The entire block is available at step %d, with failure rate %d !" % (steps, self.shape.failureRate), extra=self.format)
-                missingVector.append(missingSamples)
                 break
-            steps += 1
+            elif self.isStalled(missingVector):
+                self.logger.debug("The block cannot be recovered, failure rate %d!" % self.shape.failureRate, extra=self.format)
+                if self.config.diagnostics:
+                    self.printDiagnostics()
+                break
+            elif self.config.skipUnrecoverable and self.maxReady < self.config.successCondition:
+                self.logger.debug("The block can never be available, failure rate %d!" % self.shape.failureRate, extra=self.format)
+                break
+            self.steps += 1
+            if self.stepCallback:
+                self.stepCallback(self.steps)
 
-        progress = pd.DataFrame(progressVector)
-        if self.config.saveRCdist:
-            self.result.addMetric("rowDist", self.distR)
-            self.result.addMetric("columnDist", self.distC)
-        if self.config.saveProgress:
-            self.result.addMetric("progress", progress.to_dict(orient='list'))
-        self.result.populate(self.shape, self.config, missingVector)
+        self.finishBlock(self.result, progress, missingVector)
+        if self.store:
+            self.store.flush()
+        if self.trace:
+            self.trace.close()
+        if self.config.saveTrafficDist:
+            trafficDist, trafficPeaks = self.glob.getTrafficDistribution()
+            self.result.addMetric("trafficDist", trafficDist)
+            self.result.addMetric("trafficPeaks", trafficPeaks)
         return self.result
 
+    def runBlocks(self):
+        """It runs numberBlocks consecutive blocks on the same network, one every blockSpacing steps.
+
+            Blocks in flight share the uplink of the nodes, the oldest block
+            being served first. Each block runs until it is available or it
+            gets stuck, but a block is only given up once all older blocks
+            are finished. Progress is recorded per block, with the number of
+            segments queued for sending.
+            Returns: the list of results, one per block.
+        """
+        self.glob.checkRowsColumns(self.validators)
+        for v in self.validators:
+            if not v.amIproposer:
+                v.logIDs()
+        blocks = {} # blockID -> (result, progress, missingVector)
+        results = []
+        active = []
+        started = 0
+        steps = 0
+        while len(results) < self.config.numberBlocks:
+            while started < self.config.numberBlocks and steps >= started * self.config.blockSpacing:
+                self.logger.debug("NEW BLOCK %d at step %d" % (started, steps), extra=self.format)
+                for v in self.validators:
+                    if started:
+                        v.newBlock(started)
+                    else:
+                        v.useBlock(started)
+                self.validators[self.proposerID].initBlock()
+                if self.trace:
+                    self.trace.recordBlock(steps, started, self.proposerID, self.validators[self.proposerID].block.data)
+                arrived, expected, ready, validatedall, validated = self.glob.checkStatus(self.validators)
+                result = Result(self.shape, self.execID, started)
+                self.checkRecoverable(result)
+                blocks[started] = (result, MetricsRecorder(self.progressMetrics + ["queued segments"]), [expected - arrived])
+                active.append(started)
+                started += 1
+
+            self.logger.debug("PHASE SEND %d" % steps, extra=self.format)
+            for v in self.validators:
+                v.sendBlocks(steps, active)
+            self.logger.debug("PHASE RECEIVE %d" % steps, extra=self.format)
+            for v in self.validators[1:]:
+                for blockID in active:
+                    v.useBlock(blockID)
+                    v.receiveRowsColumns(steps)
+            self.logger.debug("PHASE RESTORE %d" % steps, extra=self.format)
+            for v in self.validators[1:]:
+                for blockID in active:
+                    v.useBlock(blockID)
+                    v.restoreRows()
+                    v.restoreColumns()
+
+            # log TX and RX statistics
+            trafficStats = self.glob.getTrafficStats()
+            self.glob.traffic.endStep()
+            self.logger.debug("step %d: %s", steps, trafficStats, extra=self.format)
+
+            for blockID in list(active):
+                for v in self.validators:
+                    v.useBlock(blockID)
+                result, progress, missingVector = blocks[blockID]
+                queued = sum(v.queuedSegments() for v in self.validators)
+                missingVector.append(self.recordProgress(steps, progress, trafficStats, queued))
+                if missingVector[-1] == 0:
+                    self.logger.debug("Block %d is available at step %d" % (blockID, steps), extra=self.format)
+                elif blockID == active[0] and self.isStalled(missingVector, blockID):
+                    self.logger.debug("Block %d cannot be recovered" % blockID, extra=self.format)
+                    if self.config.diagnostics:
+                        self.printDiagnostics()
+                else:
+                    continue
+                self.finishBlock(result, progress, missingVector, blockID)
+                results.append(result)
+                active.remove(blockID)
+                for v in self.validators:
+                    v.dropBlock(blockID)
+            steps += 1
+            if self.stepCallback:
+                self.stepCallback(steps)
+
+        results.sort(key=lambda result: result.blockID)
+        if self.trace:
+            self.trace.close()
+        if self.config.saveTrafficDist:
+            # traffic is shared by all blocks, so its distribution is that of the whole run
+            trafficDist, trafficPeaks = self.glob.getTrafficDistribution()
+            for result in results:
+                result.addMetric("trafficDist", trafficDist)
+                result.addMetric("trafficPeaks", trafficPeaks)
+        return results
+
+def runVariant(data, config, variant):
+    """It restores a simulation from a snapshot, applies a variant to it and runs it to the end."""
+    sim = Simulator.restore(data, config)
+    variant(sim)
+    return sim.run()
@@ -0,0 +1,83 @@
+#!/bin/python3
+
+import hashlib
+import zlib
+import numpy as np
+
+class RandomStreams:
+    """This class derives independent random streams from the seed of a shape.
+
+    Each stream is a counter-based (Philox) NumPy Generator keyed by a purpose
+    (e.g. "topology", "failures") and optionally by a node ID. Draws in one
+    stream do not depend on how many draws were made in any other, so results
+    do not depend on the order in which nodes are processed. Without a seed,
+    streams are seeded from OS entropy.
+    """
+
+    def __init__(self, seed = ""):
+        """It derives the root entropy from the seed string."""
+        if seed:
+            self.entropy = int.from_bytes(hashlib.sha256(str(seed).encode()).digest()[:16], "big")
+        else:
+            self.entropy = np.random.SeedSequence().entropy
+
+    def generator(self, purpose, nodeID = None, blockID = 0):
+        """It returns a new Generator for a purpose (and node and block, if given)."""
+        key = (zlib.crc32(purpose.encode()), 0 if nodeID is None else nodeID + 1)
+        if blockID:
+            key += (blockID,)
+        seq = np.random.SeedSequence(self.entropy, spawn_key=key)
+        return np.random.Generator(np.random.Philox(seq))
+
+    def seed(self, purpose, nodeID = None):
+        """It returns a 32-bit integer seed for libraries taking their own seed."""
+        return int(self.generator(purpose, nodeID).integers(2**32))
+
+
+class PermutationBuffer:
+    """This class hands out random permutations drawn in batches.
+
+    Permutations of small sizes (e.g. neighbor lists and active queues) are
+    drawn batchSize at a time per size and served from the buffer. Larger
+    ones are drawn one at a time.
+    """
+
+    def __init__(self, rng, batchSize = 64, maxSize = 64):
+        """It sets the generator and the batching limits."""
+        self.rng = rng
+        self.batchSize = batchSize
+        self.maxSize = maxSize
+        self.buffers = {}
+
+    def permutation(self, n):
+        """It returns a random permutation of range(n), as a list."""
+        if n > self.maxSize:
+            return self.rng.permutation(n).tolist()
+        return self.buffer(n).pop()
+
+    def buffer(self, n):
+        """It returns the buffer of permutations of size n, drawing a new batch if it is empty."""
+        buffer = self.buffers.get(n)
+        if not buffer:
+            batch = np.tile(np.arange(n), (self.batchSize, 1))
+            buffer = self.rng.permuted(batch, axis=1).tolist()
+            buffer.reverse()
+            self.buffers[n] = buffer
+        return buffer
+
+    def permutations(self, n, count):
+        """It returns count permutations of range(n) as the rows of an array, the same as count calls to permutation."""
+        if n > self.maxSize:
+            return np.array([self.rng.permutation(n) for i in range(count)], dtype=np.int64).reshape(count, n)
+        buffer = self.buffers.get(n) or []
+        taken = min(count, len(buffer))
+        parts = [np.array(buffer[len(buffer)-taken:][::-1], dtype=np.int64).reshape(taken, n)]
+        del buffer[len(buffer)-taken:]
+        # the batches the buffer would draw, kept as arrays
+        batch = np.tile(np.arange(n), (self.batchSize, 1))
+        for i in range(-(-(count - taken) // self.batchSize)):
+            parts.append(self.rng.permuted(batch, axis=1))
+        rows = np.concatenate(parts)
+        if len(rows) > count:
+            self.buffers[n] = rows[count:][::-1].tolist()
+        return rows[:count]
@@ -0,0 +1,183 @@
+#!/bin/python3
+
+import math
+import collections
+from DAS.failures import failurePattern
+from DAS.results import Result
+from DAS.streams import RandomStreams
+from DAS.tools import bitMatrix, peel
+
+# Surrogate prediction of a shape: available is True, False, or None if uncertain.
+# TTA bounds are in ms, None if the block is not available.
+Estimate = collections.namedtuple("Estimate", ["available", "ttaLow", "ttaHigh", "reason"])
+
+class Surrogate:
+    """This class predicts the availability and TTA bounds of a shape in milliseconds, without simulating it.
+
+    Availability is decided on the initial block of the shape (drawn from the
+    same random stream as the simulator): if the peeling decoder cannot
+    repair it, enough lines never complete and the block is not available.
+    If it can, the block is available provided that repaired segments can
+    cross from rows to columns, i.e. every segment is expected to be in the
+    custody of enough nodes of both its row and column. Otherwise the shape
+    is uncertain and it has to be simulated.
+
+    The lower TTA bound holds for any run: a validator is only ready once it
+    got the segments its lines are made of, which all leave the proposer,
+    within its uplink, at least the minimum link latency earlier. The upper
+    bound is a pessimistic estimate from a mean-field propagation of the
+    segments of a line over its topic graph: an average custodian receives
+    them from the proposer and from a single neighbor per line, within their
+    uplink budget, each hop taking the maximum link latency, until it has
+    half of each of its lines and can repair them. A shape predicted
+    available is only left out of the simulations if its bounds are close
+    enough, see screens.
+    """
+
+    def __init__(self, config, risk = 0.01, margin = 0.1, maxSteps = 10000, spread = 3):
+        """It sets the accepted probability of a segment without crossing node, the margin on the ready ratio,
+        and the number of standard deviations of a normal link latency taken as its maximum."""
+        self.config = config
+        self.risk = risk
+        self.margin = margin
+        self.maxSteps = maxSteps
+        self.spread = spread
+
+    def segmentsPerStep(self, bwUplink):
+        """It returns the uplink of a node in segments per step, as in Validator."""
+        return bwUplink * 1e3 / 8 * self.config.stepDuration / self.config.segmentSize
+
+    @staticmethod
+    def custodyLines(blockSize, chi, vpn):
+        """It returns the expected number of distinct rows (or columns) in custody of a node."""
+        return blockSize * (1 - (1 - min(chi, blockSize) / blockSize) ** vpn)
+
+    def classes(self, shape):
+        """It returns the number of nodes, custody lines (rows) and uplink (segments/step) of each class."""
+        lightNodes = int((shape.numberNodes - 1) * shape.class1ratio)
+        heavyNodes = shape.numberNodes - 1 - lightNodes
+        return [(lightNodes, self.custodyLines(shape.blockSize, shape.chi, shape.vpn1), self.segmentsPerStep(shape.bwUplink1)),
+                (heavyNodes, self.custodyLines(shape.blockSize, shape.chi, shape.vpn2), self.segmentsPerStep(shape.bwUplink2))]
+
+    def initialBlock(self, shape):
+        """It returns the segments released by the proposer, as a boolean matrix."""
+        rng = RandomStreams(shape.randomSeed).generator("failures")
+        pattern = failurePattern(shape.failureModel, shape.blockSize, shape.failureRate, rng)
+        return bitMatrix(pattern, shape.blockSize)
+
+    def propagate(self, shape, degree):
+        """It returns the steps for an average custodian to get half of each of its lines.
+
+            Each custodian receives from degree neighbors per line, and from the
+            proposer. Returns None if it never gets there.
+        """
+        bs = shape.blockSize
+        classes = self.classes(shape)
+        holders = sum(n * lines for n, lines, rate in classes)
+        if holders == 0:
+            return None
+        custodians = holders / bs # per line
+        links = min(shape.netDegree, max(custodians - 1, 1))
+        # uplink per link and step of an average sender, weighted by its custody
+        budget = sum(n * lines * rate / (2 * lines * links) for n, lines, rate in classes) / holders
+        released = (1 - shape.failureRate / 100) * bs
+        publishTo = min(shape.netDegree, custodians)
+        injection = self.segmentsPerStep(shape.bwUplinkProd) / (2 * bs * publishTo) # per link and step
+        injected = 0
+        segments = 0
+        for step in range(1, self.maxSteps):
+            fromProposer = min(injection, released - injected) * publishTo / custodians
+            injected += min(injection, released - injected)
+            gossip = min(degree, links) * min(budget, segments * (1 - segments / bs))
+            segments = min(bs, segments + fromProposer + gossip)
+            if segments >= bs / 2:
+                return step
+            if fromProposer + gossip <= 1e-9:
+                return None
+        return None
+
+    def delays(self):
+        """It returns the minimum and maximum link delay in steps, as drawn in Simulator.linkDelays.
+
+            A normal latency is cut at 0, and taken up to spread standard
+            deviations above its mean.
+        """
+        model, *params = self.config.linkLatency
+        if model == "constant":
+            low = high = params[0]
+        elif model == "uniform":
+            low, high = params[0], params[1]
+        elif model == "normal":
+            low, high = 0, params[0] + self.spread * params[1]
+        else:
+            low = high = 0
+        step = self.config.stepDuration
+        return int(max(low, 0) // step), int(max(high, 0) // step)
+
+    def bounds(self, shape, rounds):
+        """It returns the lower and upper TTA bounds (ms) of a decodable shape, or None if it does not propagate.
+
+            A virtual validator is ready once its chi rows and chi columns are
+            complete, which takes at least 2 chi k - chi^2 distinct segments,
+            with k = blockSize/2 segments to repair a line. They leave the
+            proposer at most ceil(bwUplinkProd) segments per step, and arrive
+            at least the minimum delay later. The upper bound is the mean-field
+            propagation with a single neighbor per line, each hop taking one
+            step plus the maximum delay, followed by the repair rounds.
+        """
+        slow = self.propagate(shape, 1)
+        if slow is None:
+            return None
+        low, high = self.delays()
+        k = math.ceil(shape.blockSize / 2)
+        lines = min(shape.chi, k)
+        segments = 2 * lines * k - lines * lines
+        rate = max(math.ceil(self.segmentsPerStep(shape.bwUplinkProd)), 1)
+        lowSteps = math.ceil(segments / rate) - 1 + low
+        highSteps = slow * (1 + high) + rounds
+        return lowSteps * self.config.stepDuration, max(highSteps, lowSteps) * self.config.stepDuration
+
+    def screens(self, estimate):
+        """It checks whether the shape of an estimate can be left out of the simulations.
+
+            Shapes never available are, and so are available shapes whose TTA
+            bounds are at most screenTolerance ms apart.
+        """
+        if estimate.available is None:
+            return False
+        if not estimate.available:
+            return True
+        return estimate.ttaHigh - estimate.ttaLow <= self.config.screenTolerance
+
+    def estimate(self, shape):
+        """It returns the Estimate of a shape."""
+        bs = shape.blockSize
+        data, rounds = peel(self.initialBlock(shape))
+        if not data.all():
+            # lines never complete, the ready ratio is bounded by the fraction of complete lines
+            rows, columns = data.all(axis=1).mean(), data.all(axis=0).mean()
+            ready = (rows * columns) ** shape.chi
+            if ready + self.margin < self.config.successCondition:
+                return Estimate(False, None, None, "not decodable")
+            return Estimate(None, None, None, "partially decodable")
+
+        if rounds > 1:
+            # expected number of nodes in custody of both the row and the column of a segment
+            crossing = sum(n * (lines / bs) ** 2 for n, lines, rate in self.classes(shape))
+            if bs * bs * math.exp(-crossing) > self.risk:
+                return Estimate(None, None, None, "few crossing nodes")
+
+        bounds = self.bounds(shape, rounds)
+        if bounds is None:
+            return Estimate(None, None, None, "no propagation")
+        return Estimate(True, bounds[0], bounds[1], "decodable")
+
+    def result(self, shape, execID, estimate):
+        """It returns the Result of a shape predicted by the surrogate, labelled as such, with the upper TTA bound."""
+        result = Result(shape, execID)
+        result.surrogate = True
+        result.blockAvailable = int(estimate.available)
+        result.tta = estimate.ttaHigh if estimate.available else -1
+        result.addMetric("ttaBounds", [estimate.ttaLow, estimate.ttaHigh])
+        result.addMetric("surrogateReason", estimate.reason)
+        return result
@@ -0,0 +1,149 @@
+#!/bin/python3
+
+import os
+import json
+import time
+import threading
+
+def writeJSON(path, data):
+    """It writes a JSON file atomically, so that readers never see a partial file."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class WorkerStatus:
+    """This class publishes the progress of a worker process in a status file.
+
+    There is one status file per process and sweep, holding the shape being
+    simulated, its step, and the shapes completed so far. Step updates are
+    written at most once per interval, so the overhead is negligible.
+    """
+
+    # Status of the current process, per status folder
+    instances = {}
+
+    def __init__(self, folder, interval):
+        """It creates the status file of the process."""
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, "worker-%d.json" % os.getpid())
+        self.interval = interval
+        self.status = {"pid": os.getpid(), "shape": None, "started": None, "steps": 0,
+                       "completed": [], "completedSteps": 0, "updated": time.time()}
+        self.lastWrite = 0
+
+    @classmethod
+    def get(cls, folder, interval):
+        """It returns the status of the current process for a folder, creating it if needed."""
+        if folder not in cls.instances:
+            cls.instances[folder] = cls(folder, interval)
+        return cls.instances[folder]
+
+    def write(self):
+        """It writes the status file."""
+        self.status["updated"] = self.lastWrite = time.time()
+        writeJSON(self.path, self.status)
+
+    def start(self, shape):
+        """It records the start of the simulation of a shape."""
+        self.status.update(shape=shape, started=time.time(), steps=0)
+        self.write()
+
+    def step(self, steps):
+        """It records the number of steps simulated, writing it if the interval elapsed."""
+        self.status["steps"] = steps
+        if time.time() - self.lastWrite >= self.interval:
+            self.write()
+
+    def finish(self):
+        """It records the end of the simulation of the current shape."""
+        self.status["completed"].append(self.status["shape"])
+        self.status["completedSteps"] += self.status["steps"]
+        self.status.update(shape=None, started=None, steps=0)
+        self.write()
+
+
+class SweepMonitor(threading.Thread):
+    """This class reports the progress of a sweep, from the status files of the workers.
+
+    Every interval, it aggregates the worker status files into a status
+    file (status.json) and a line on the terminal: completed and remaining
+    shapes, simulations per minute, steps per second over all workers, the
+    running shapes with their elapsed time, and an ETA weighting shapes by
+    their estimated cost.
+    """
+
+    def __init__(self, folder, shapes, costs, interval, logger):
+        """It sets the shapes of the sweep (labels) and their estimated costs."""
+        super().__init__(daemon=True)
+        self.folder = folder
+        self.costs = dict(zip(shapes, costs))
+        self.interval = interval
+        self.logger = logger
+        self.format = {"entity": "Study"}
+        self.startTime = time.time()
+        self.lastSteps = 0
+        self.lastTime = self.startTime
+        self.stopped = threading.Event()
+
+    def collect(self):
+        """It aggregates the worker status files into the sweep status."""
+        now = time.time()
+        elapsed = now - self.startTime
+        completed = []
+        running = []
+        steps = 0
+        for filename in os.listdir(self.folder):
+            if not (filename.startswith("worker-") and filename.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.folder, filename)) as f:
+                    worker = json.load(f)
+            except (OSError, ValueError):
+                continue
+            completed += worker["completed"]
+            steps += worker["completedSteps"] + worker["steps"]
+            if worker["shape"] is not None:
+                running.append({"shape": worker["shape"], "worker": worker["pid"],
+                                "elapsed": now - worker["started"], "steps": worker["steps"]})
+
+        totalCost = sum(self.costs.values())
+        doneCost = sum(self.costs.get(shape, 0) for shape in completed)
+        # running shapes are counted as half done
+        doneCost += sum(self.costs.get(shape["shape"], 0) for shape in running) / 2
+        eta = max(elapsed * (totalCost - doneCost) / doneCost, 0) if doneCost > 0 else None
+        stepsPerSecond = (steps - self.lastSteps) / max(now - self.lastTime, 1e-9)
+        self.lastSteps, self.lastTime = steps, now
+        return {
+            "elapsed": elapsed,
+            "completed": len(completed),
+            "remaining": len(self.costs) - len(completed),
+            "total": len(self.costs),
+            "simulationsPerMinute": 60 * len(completed) / max(elapsed, 1e-9),
+            "stepsPerSecond": stepsPerSecond,
+            "eta": eta,
+            "running": sorted(running, key=lambda shape: -shape["elapsed"]),
+            }
+
+    def report(self):
+        """It writes the sweep status file and logs a summary line."""
+        status = self.collect()
+        writeJSON(os.path.join(self.folder, "status.json"), status)
+        eta = "%ds" % status["eta"] if status["eta"] is not None else "?"
+        running = ", ".join("%s (%ds)" % (shape["shape"], shape["elapsed"]) for shape in status["running"][:3])
+        self.logger.info("%d/%d shapes done, %.1f sim/min, %.0f steps/s, ETA %s, running: %s"
+                         % (status["completed"], status["total"], status["simulationsPerMinute"],
+                            status["stepsPerSecond"], eta, running), extra=self.format)
+        return status
+
+    def run(self):
+        """It reports the status every interval, until stopped."""
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def stop(self):
+        """It stops the monitor and writes the final status."""
+        self.stopped.set()
+        self.join()
+        return self.report()
@@ -3,7 +3,8 @@
 import logging
 import sys
 import random
-from bitarray.util import zeros
+import numpy as np
+from bitarray import bitarray
 class CustomFormatter():
     """This class defines the terminal output formatting."""
 
@@ -30,23 +31,29 @@ class CustomFormatter():
         formatter = logging.Formatter(log_fmt)
         return formatter.format(record)
 
-def shuffled(lis, shuffle=True):
-    """Generator yielding list in shuffled order."""
+def shuffled(lis, shuffle=True, perms=None):
+    """Generator yielding list in shuffled order.
+
+        The order is taken from a PermutationBuffer if given, otherwise from
+        the global random module.
+    """
     # based on https://stackoverflow.com/a/60342323
     if shuffle:
-        for index in random.sample(range(len(lis)), len(lis)):
+        order = perms.permutation(len(lis)) if perms else random.sample(range(len(lis)), len(lis))
+        for index in order:
             yield lis[index]
     else:
         for v in lis:
             yield v
-def shuffledDict(d, shuffle=True):
+def shuffledDict(d, shuffle=True, perms=None):
     """Generator yielding dictionary in shuffled order.
 
         Shuffle, except if not (optional parameter useful for experiment setup).
     """
     if shuffle:
         lis = list(d.items())
-        for index in random.sample(range(len(d)), len(d)):
+        order = perms.permutation(len(d)) if perms else random.sample(range(len(d)), len(d))
+        for index in order:
             yield lis[index]
     else:
         for kv in d.items():
@@ -55,7 +62,8 @@ def shuffledDict(d, shuffle=True):
 def sampleLine(line, limit):
     """Sample up to 'limit' bits from a bitarray.
 
-        Since this is quite expensive, we use a number of heuristics to get it fast.
+        Set bits are located and selected with array operations, without
+        per-bit Python loops.
     """
     if limit == sys.maxsize :
         return line
@@ -64,21 +72,46 @@ def sampleLine(line, limit):
         if limit >= w :
             return line
         else:
-            l = len(line)
-            r = zeros(l)
-            if w < l/10 or limit > l/2 :
-                indices = [ i for i in range(l) if line[i] ]
-                sample = random.sample(indices, limit)
-                for i in sample:
-                    r[i] = 1
-                return r
-            else:
-                while limit:
-                    i = random.randrange(0, l)
-                    if line[i] and not r[i]:
-                        r[i] = 1
-                        limit -= 1
-                return r
+            indices = np.flatnonzero(np.frombuffer(line.unpack(), dtype=np.uint8))
+            selected = np.zeros(len(line), dtype=np.uint8)
+            selected[indices[random.sample(range(w), limit)]] = 1
+            r = bitarray()
+            r.pack(selected.tobytes())
+            return r
+
+def lineMask(blockSize, ids):
+    """It returns the bitmask of a set of line IDs (any shape) and the sorted list of IDs."""
+    mask = np.zeros(blockSize, dtype=np.uint8)
+    mask[np.asarray(ids, dtype=np.int64).ravel()] = 1
+    bits = bitarray()
+    bits.pack(mask.tobytes())
+    return bits, np.flatnonzero(mask).tolist()
+
+def bitMatrix(bits, blockSize):
+    """It returns a block held in a bitarray (row order) as a boolean matrix."""
+    return np.frombuffer(bits.unpack(), dtype=np.uint8)[:blockSize*blockSize].reshape(blockSize, blockSize).astype(bool)
+
+def peel(segments):
+    """It repairs a block (boolean matrix) with the row/column peeling decoder.
+
+        Lines with at least half of their segments are repaired, rows then
+        columns, until no line can be repaired.
+        Returns: the repaired block and the number of rounds (row and column
+        passes) that repaired segments.
+    """
+    data = np.array(segments, dtype=bool)
+    half = data.shape[0] / 2
+    rounds = 0
+    while True:
+        rows = data.sum(axis=1) >= half
+        repaired = (rows[:, None] & ~data).any()
+        data[rows] = True
+        columns = data.sum(axis=0) >= half
+        repaired |= (columns[None, :] & ~data).any()
+        data[:, columns] = True
+        if not repaired:
+            return data, rounds
+        rounds += 1
 
 def unionOfSamples(population, sampleSize, times):
     selected = set()
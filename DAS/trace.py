@@ -0,0 +1,184 @@
+#!/bin/python3
+
+import concurrent.futures
+import mmap
+import struct
+import zlib
+import numpy as np
+
+# Kinds of events
+SEND, RECEIVE, DUPLICATE, REPAIR, INIT = range(5)
+eventKinds = ["send", "receive", "duplicate", "repair", "init"]
+
+# One fixed-width record per segment event. For sends and receives, src and
+# dst are the two ends of the link; for repairs and initial segments, both
+# are the node holding the segment.
+eventType = np.dtype([("step", "<u4"), ("block", "<u2"), ("kind", "u1"), ("src", "<u4"),
+                      ("dst", "<u4"), ("row", "<u2"), ("column", "<u2")])
+
+traceMagic = b"DASTRACE"
+fileHeader = struct.Struct("<8sHHI")   # magic, version, blockSize, numberNodes
+chunkHeader = struct.Struct("<IIII")   # records, compressed bytes, first step, last step
+
+
+class TraceWriter:
+    """This class records the segments moving in a simulation in a binary trace file.
+
+    Events are recorded per line: the segments of a line delivered on a link
+    (sent, received new and received twice), or repaired by a node. Lines are
+    buffered as bitmaps, and expanded into one record per segment when
+    written, in zlib-compressed chunks of up to chunkSize/blockSize lines.
+    Each chunk has a header holding its step range, so that a reader only
+    decompresses the chunks of the steps it looks at. Sends are recorded
+    when delivered, so segments still in flight at the end are not in the
+    trace.
+    """
+
+    def __init__(self, path, blockSize, numberNodes, chunkSize = 65536, level = 1):
+        """It creates the trace file and writes its header."""
+        self.path = path
+        self.blockSize = blockSize
+        self.lineBytes = (blockSize + 7) // 8
+        self.maxLines = max(chunkSize // blockSize, 1)
+        self.level = level
+        self.lines = []      # (step, block, kind, src, dst, dim, lineID, segments)
+        self.deliveries = [] # (sent step, step, block, src, dst, dim, lineID, segments, new segments)
+        self.file = open(path, "wb")
+        self.file.write(fileHeader.pack(traceMagic, 1, blockSize, numberNodes))
+        # chunks are compressed and written by a thread (zlib releases the GIL)
+        self.writer = concurrent.futures.ThreadPoolExecutor(1)
+        self.written = None
+
+    def recordLine(self, step, block, kind, src, dst, dim, lineID, segments):
+        """It records the same event for the segments of a line set in a bitarray."""
+        self.lines.append((step, block, kind, src, dst, dim, lineID, segments.tobytes()))
+        if len(self.lines) >= self.maxLines:
+            self.flush()
+
+    def recordDelivery(self, sent, step, block, src, dst, dim, lineID, segments, new):
+        """It records the segments of a line sent at step sent and delivered at step.
+
+            The new segments (a bitarray not modified afterwards) are kept as is,
+            the others are copied.
+        """
+        self.deliveries.append((sent, step, block, src, dst, dim, lineID, segments.tobytes(), new))
+        if len(self.deliveries) >= self.maxLines:
+            self.flush()
+
+    def recordBlock(self, step, block, nodeID, data):
+        """It records the segments of a full block (bitarray in row order) held by a node."""
+        for rID in range(self.blockSize):
+            self.recordLine(step, block, INIT, nodeID, nodeID, 0, rID, data[rID*self.blockSize:(rID+1)*self.blockSize])
+
+    def unpack(self, lines):
+        """It returns lines (bytes-like) as a boolean matrix, one row per line."""
+        bits = np.frombuffer(b"".join(lines), dtype=np.uint8).reshape(-1, self.lineBytes)
+        return np.unpackbits(bits, axis=1)[:, :self.blockSize].astype(bool)
+
+    def expand(self, fields, bits):
+        """It returns one record per segment set in bits, from the fields of its line."""
+        lines, ids = np.nonzero(bits)
+        records = np.empty(len(lines), dtype=eventType)
+        for name, values in zip(["step", "block", "kind", "src", "dst"], fields):
+            records[name] = values[lines] if np.ndim(values) else values
+        dim, lineID = fields[5][lines], fields[6][lines]
+        records["row"] = np.where(dim == 0, lineID, ids)
+        records["column"] = np.where(dim == 0, ids, lineID)
+        return records
+
+    def flush(self):
+        """It expands the buffered lines into records, and writes them as a compressed chunk."""
+        parts = []
+        if self.lines:
+            columns = list(zip(*self.lines))
+            fields = [np.array(column) for column in columns[:7]]
+            parts.append(self.expand(fields, self.unpack(columns[7])))
+        if self.deliveries:
+            columns = list(zip(*self.deliveries))
+            sent, step, block, src, dst, dim, lineID = (np.array(column) for column in columns[:7])
+            segments, new = self.unpack(columns[7]), self.unpack(columns[8])
+            parts.append(self.expand((sent, block, SEND, src, dst, dim, lineID), segments))
+            parts.append(self.expand((step, block, RECEIVE, src, dst, dim, lineID), new))
+            parts.append(self.expand((step, block, DUPLICATE, src, dst, dim, lineID), segments & ~new))
+        self.lines = []
+        self.deliveries = []
+        chunk = np.concatenate(parts) if parts else []
+        if not len(chunk):
+            return
+        if self.written:
+            self.written.result()
+        self.written = self.writer.submit(self.writeChunk, chunk)
+
+    def writeChunk(self, chunk):
+        """It compresses and writes a chunk of records."""
+        data = zlib.compress(chunk.tobytes(), self.level)
+        self.file.write(chunkHeader.pack(len(chunk), len(data), chunk["step"].min(), chunk["step"].max()))
+        self.file.write(data)
+
+    def close(self):
+        """It writes the last events and closes the file."""
+        self.flush()
+        self.writer.shutdown()
+        self.file.close()
+
+
+class EventTrace:
+    """This class reads a trace file, to replay and analyse a simulation without running it.
+
+    The file is memory-mapped and only the chunk headers are read when
+    opening it. Chunks are decompressed on demand, for the steps queried.
+    """
+
+    def __init__(self, path):
+        """It maps the trace file and indexes its chunks."""
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.blockSize, self.numberNodes = fileHeader.unpack_from(self.map, 0)
+        if magic != traceMagic:
+            raise ValueError("%s is not a trace file" % path)
+        self.chunks = [] # (offset of the data, records, compressed bytes, first step, last step)
+        offset = fileHeader.size
+        while offset + chunkHeader.size <= len(self.map):
+            records, size, first, last = chunkHeader.unpack_from(self.map, offset)
+            offset += chunkHeader.size
+            self.chunks.append((offset, records, size, first, last))
+            offset += size
+
+    def events(self, first = 0, last = None, kinds = None):
+        """It returns the events from step first to last (included), optionally of some kinds only."""
+        parts = []
+        for offset, records, size, firstStep, lastStep in self.chunks:
+            if lastStep < first or (last is not None and firstStep > last):
+                continue
+            parts.append(np.frombuffer(zlib.decompress(self.map[offset:offset+size]), dtype=eventType))
+        events = np.concatenate(parts) if parts else np.empty(0, dtype=eventType)
+        selected = events["step"] >= first
+        if last is not None:
+            selected &= events["step"] <= last
+        if kinds is not None:
+            selected &= np.isin(events["kind"], kinds)
+        return events[selected]
+
+    def nodeState(self, nodeID, step, blockID = 0):
+        """It returns the segments a node holds at the end of a step, as a boolean matrix."""
+        events = self.events(0, step, [RECEIVE, REPAIR, INIT])
+        events = events[(events["dst"] == nodeID) & (events["block"] == blockID)]
+        state = np.zeros((self.blockSize, self.blockSize), dtype=bool)
+        state[events["row"], events["column"]] = True
+        return state
+
+    def linkStats(self, first = 0, last = None):
+        """It returns the segments sent, received new and received twice per link (src, dst)."""
+        events = self.events(first, last, [SEND, RECEIVE, DUPLICATE])
+        links, index = np.unique(np.stack((events["src"], events["dst"]), axis=1), axis=0, return_inverse=True)
+        index = index.reshape(-1)
+        stats = np.zeros(len(links), dtype=[("src", "<u4"), ("dst", "<u4"), ("sent", "<i8"),
+                                            ("received", "<i8"), ("duplicates", "<i8")])
+        stats["src"], stats["dst"] = links.T
+        for field, kind in (("sent", SEND), ("received", RECEIVE), ("duplicates", DUPLICATE)):
+            stats[field] = np.bincount(index[events["kind"] == kind], minlength=len(links))
+        return stats
+
+    def close(self):
+        """It unmaps the file."""
+        self.map.close()
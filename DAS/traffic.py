@@ -0,0 +1,126 @@
+#!/bin/python3
+
+import numpy as np
+
+class TrafficCounters:
+    """This class keeps the per-node traffic counters of the network in arrays.
+
+    Counters are indexed by node ID. Nodes add what they send and receive to
+    rows TX, RX and RXDUP of the current array as they go, and the current
+    step is moved to the history (the last historySize steps) at its end. Once the history is full, it is flushed to flushHandler
+    (if any) and started again.
+    """
+
+    TX = 0
+    RX = 1
+    RXDUP = 2
+    names = ["Tx", "Rx", "RxDup"]
+
+    def __init__(self, nodeClasses, historySize = 64):
+        """It allocates the counters for the nodes of the given classes."""
+        self.nodeClass = np.asarray(nodeClasses, dtype=np.int8)
+        self.numberNodes = len(self.nodeClass)
+        self.classIndex = [np.flatnonzero(self.nodeClass == cl) for cl in range(3)]
+        self.current = np.zeros((3, self.numberNodes), dtype=np.uint32)
+        self.history = np.zeros((historySize, 3, self.numberNodes), dtype=np.uint32)
+        self.historyLen = 0
+        self.flushHandler = None
+
+    def endStep(self):
+        """It appends the current step to the history, flushing it if full, and zeroes the counters."""
+        self.history[self.historyLen] = self.current
+        self.current[:] = 0
+        self.historyLen += 1
+        if self.historyLen == len(self.history):
+            self.flush()
+
+    def flush(self):
+        """It passes the history to the flush handler and empties it.
+
+            Returns: the flushed steps, as a (steps x 3 x nodes) array.
+        """
+        flushed = self.history[:self.historyLen]
+        if self.flushHandler:
+            self.flushHandler(flushed)
+        self.historyLen = 0
+        return flushed
+
+    def getStats(self):
+        """Summary statistics (mean and max per class) of the current step."""
+        trafficStats = {}
+        for cl in range(0,3):
+            counters = self.current[:, self.classIndex[cl]]
+            if counters.shape[1]:
+                means = counters.mean(axis=1)
+                maxs = counters.max(axis=1)
+            else:
+                means = maxs = np.full(3, np.nan)
+            trafficStats[cl] = {name: {"mean": means[i], "max": maxs[i]} for i, name in enumerate(self.names)}
+        return trafficStats
+
+
+class TrafficRecorder:
+    """This class builds the distribution of per-node per-step traffic of a run.
+
+    It consumes the history chunks flushed by TrafficCounters. For each class
+    and counter, it keeps a histogram of the per-node per-step values, and for
+    each node the peak step value. Memory use is thus bounded by the largest
+    value seen, not by the length of the run.
+    """
+
+    percentiles = [50, 95, 99]
+
+    def __init__(self, counters):
+        """It attaches the recorder to the given traffic counters."""
+        self.counters = counters
+        self.histograms = [[np.zeros(0, dtype=np.int64) for name in counters.names] for cl in range(3)]
+        self.peak = np.zeros((3, counters.numberNodes), dtype=counters.history.dtype)
+        counters.flushHandler = self.addChunk
+
+    def addChunk(self, chunk):
+        """It adds a (steps x 3 x nodes) chunk of counters to the distributions."""
+        if not len(chunk):
+            return
+        np.maximum(self.peak, chunk.max(axis=0), out=self.peak)
+        for cl in range(3):
+            index = self.counters.classIndex[cl]
+            if not len(index):
+                continue
+            for m in range(len(self.counters.names)):
+                hist = np.bincount(chunk[:, m, index].ravel())
+                old = self.histograms[cl][m]
+                if len(hist) > len(old):
+                    hist[:len(old)] += old
+                    self.histograms[cl][m] = hist
+                else:
+                    old[:len(hist)] += hist
+
+    def getDistribution(self):
+        """It returns the percentiles and max of each counter, per node class.
+
+            Percentiles are taken over all (node, step) values of the class
+            ("step") and over the per-node peaks ("peak").
+        """
+        self.counters.flush()
+        dist = {}
+        for cl in range(3):
+            index = self.counters.classIndex[cl]
+            if not len(index):
+                continue
+            clDist = {}
+            for m, name in enumerate(self.counters.names):
+                cdf = np.cumsum(self.histograms[cl][m])
+                thresholds = np.array(self.percentiles) / 100 * cdf[-1]
+                values = np.searchsorted(cdf, thresholds, side='left')
+                peaks = np.percentile(self.peak[m, index], self.percentiles, method='lower')
+                clDist[name] = {
+                    "step": dict({"p%d" % p: int(v) for p, v in zip(self.percentiles, values)}, max=int(len(cdf) - 1)),
+                    "peak": {"p%d" % p: int(v) for p, v in zip(self.percentiles, peaks)},
+                    }
+            dist["class%d" % cl] = clDist
+        return dist
+
+    def getPeaks(self):
+        """It returns the per-node peak step value of each counter."""
+        self.counters.flush()
+        return {name: self.peak[m].tolist() for m, name in enumerate(self.counters.names)}
@@ -1,10 +1,16 @@
 #!/bin/python3
 
-import random
 import collections
 import logging
+import math
+import numpy as np
 from DAS.block import *
-from DAS.tools import shuffled, shuffledDict, unionOfSamples
+from DAS.failures import failureModels, failurePattern
+from DAS.tools import shuffled, unionOfSamples, lineMask
+from DAS.streams import RandomStreams, PermutationBuffer
+from DAS.trace import REPAIR
+from DAS.traffic import TrafficCounters
+from bitarray import bitarray
 from bitarray.util import zeros
 from collections import deque
 from itertools import chain
@@ -14,46 +20,100 @@ class Neighbor:
 
     It represents one side of a P2P link in the overlay. Sent and received
     segments are monitored to avoid sending twice or sending back what was
-    received from a link.
+    received from a link. Segments sent in a step are collected in an
+    outbox, and delivered together in the receive phase of the step they
+    arrive at, delay steps later. There is one outbox per step in flight.
+    All of these are per block, see Validator.useBlock.
     """
 
+    # Attributes holding the state of the link for the current block
+    blockFields = ["receiving", "received", "sent", "outboxes", "outboxStep", "sendQueue"]
+
     def __repr__(self):
         """It returns the amount of sent and received data."""
         return "%d:%d/%d, q:%d" % (self.node.ID, self.sent.count(1), self.received.count(1), len(self.sendQueue))
 
-    def __init__(self, v, dim, blockSize):
+    def __init__(self, v, dim, blockSize, delay = 0):
         """It initializes the neighbor with the node and sets counters to zero."""
         self.node = v
         self.dim = dim # 0:row 1:col
-        self.receiving = zeros(blockSize)
-        self.received = zeros(blockSize)
-        self.sent = zeros(blockSize)
+        self.delay = delay # in steps
+        self.blockSize = blockSize
+        self.resetState()
+
+    def __getstate__(self):
+        """It returns the link for snapshots, with the node as its ID (see Simulator.__setstate__)."""
+        state = self.__dict__.copy()
+        state["node"] = self.node.ID
+        return state
+
+    def resetState(self):
+        """It sets an empty link state, for a new block."""
+        self.receiving = zeros(self.blockSize)
+        self.received = zeros(self.blockSize)
+        self.sent = zeros(self.blockSize)
+        self.outboxes = [zeros(self.blockSize) for i in range(self.delay + 1)]
+        self.outboxStep = -1 # last step whose outbox was registered at the receiving node
         self.sendQueue = deque()
 
+    def saveState(self):
+        """It returns the link state of the current block."""
+        return [getattr(self, field) for field in self.blockFields]
+
+    def loadState(self, state):
+        """It restores a link state returned by saveState."""
+        for field, value in zip(self.blockFields, state):
+            setattr(self, field, value)
+
 
 class Validator:
     """This class implements a validator/node in the network."""
 
+    # Attributes holding the state of the node for the current block
+    blockFields = ["block", "receivedBlock", "receivedQueue", "sendQueue", "activeQueues", "queueRing", "newQueues",
+                   "completeLines", "completeLinesChanged", "validated", "segmentShuffleGen"]
+
     def __repr__(self):
         """It returns the validator ID."""
         return str(self.ID)
 
-    def __init__(self, ID, amIproposer, logger, shape, config, rows = None, columns = None):
+    def __init__(self, ID, amIproposer, logger, shape, config, rows = None, columns = None, store = None, streams = None):
         """It initializes the validator with the logger shape and rows/columns.
 
             If rows/columns are specified these are observed, otherwise (default)
-            chi rows and columns are selected randomly.
+            chi rows and columns are selected randomly. They are given as a
+            (validators x chi) matrix of line IDs, or a flat list of chi IDs per validator.
+            If a block store is given, the block is a view on the store.
+            Random draws use the node's own streams, derived from streams
+            (by default, from the seed of the shape).
         """
 
         self.shape = shape
         FORMAT = "%(levelname)s : %(entity)s : %(message)s"
         self.ID = ID
+        self.streams = streams if streams else RandomStreams(shape.randomSeed)
+        self.rng = self.streams.generator("node", self.ID)
+        self.perms = PermutationBuffer(self.streams.generator("shuffle", self.ID))
         self.format = {"entity": "Val "+str(self.ID)}
-        self.block = Block(self.shape.blockSize)
-        self.receivedBlock = Block(self.shape.blockSize)
+        self.block = None # allocated once the lines in custody are known
+        self.receivedBlock = None
         self.receivedQueue = deque()
         self.sendQueue = deque()
+        self.activeQueues = set() # positions in links of the neighbors with a non-empty send queue
+        self.queueRing = [] # active positions, in the order they are served
+        self.newQueues = [] # positions activated since the last send, not yet in the ring
+        # timing wheel of the links delivering at each step (modulo its size)
+        self.inbound = [[]]
+        self.inFlight = collections.Counter() # links in flight, per block
+        self.step = 0
+        # states of the blocks other than the current one, see useBlock
+        self.blockID = 0
+        self.blockStates = {}
+        self.segmentShuffleGen = None
+        self.dispersalPlan = None # (neighbor and line of each link, link and segment of each send, sends per step), see planDispersal
+        self.trace = None # TraceWriter recording the segment events, if any
         self.amIproposer = amIproposer
+        self.stopped = False # offline node, see Simulator.stopNodes
         self.logger = logger
         if self.shape.chi < 1:
             self.logger.error("Chi has to be greater than 0", extra=self.format)
@@ -64,28 +124,46 @@ class Validator:
                 self.nodeClass = 0
                 self.rowIDs = range(shape.blockSize)
                 self.columnIDs = range(shape.blockSize)
+                self.rowMask = bitarray(shape.blockSize)
+                self.rowMask.setall(1)
+                self.columnMask = self.rowMask.copy()
             else:
-                #if shape.deterministic:
-                #    random.seed(self.ID)
                 self.nodeClass = 1 if (self.ID <= shape.numberNodes * shape.class1ratio) else 2
                 self.vpn = self.shape.vpn1 if (self.nodeClass == 1) else self.shape.vpn2
-                self.vRowIDs = []
-                self.vColumnIDs = []
-                for i in range(self.vpn):
-                    self.vRowIDs.append(set(rows[i*self.shape.chi:(i+1)*self.shape.chi]) if rows else set(random.sample(range(self.shape.blockSize), self.shape.chi)))
-                    self.vColumnIDs.append(set(columns[i*self.shape.chi:(i+1)*self.shape.chi]) if columns else set(random.sample(range(self.shape.blockSize), self.shape.chi)))
-                self.rowIDs = set.union(*self.vRowIDs)
-                self.columnIDs = set.union(*self.vColumnIDs)
+                if rows is None or columns is None:
+                    rng = self.streams.generator("lines", self.ID)
+                    rows = rng.random((self.vpn, self.shape.blockSize)).argsort(axis=1)[:, :self.shape.chi]
+                    columns = rng.random((self.vpn, self.shape.blockSize)).argsort(axis=1)[:, :self.shape.chi]
+                # lines of each virtual validator, one row of the matrix each
+                self.vRowIDs = np.asarray(rows, dtype=np.int64).reshape(-1, self.shape.chi)[:self.vpn]
+                self.vColumnIDs = np.asarray(columns, dtype=np.int64).reshape(-1, self.shape.chi)[:self.vpn]
+                self.rowMask, self.rowIDs = lineMask(self.shape.blockSize, self.vRowIDs)
+                self.columnMask, self.columnIDs = lineMask(self.shape.blockSize, self.vColumnIDs)
+                # lines needed by each virtual validator, as indices in completeLines
+                self.requiredLines = np.concatenate((self.vRowIDs, self.shape.blockSize + self.vColumnIDs), axis=1)
+                if config.sparseBlocks:
+                    # Only keep the lines in custody, the rest is never read
+                    self.block = SparseBlock(self.shape.blockSize, self.rowIDs, self.columnIDs)
+                    self.receivedBlock = SparseBlock(self.shape.blockSize, self.rowIDs, self.columnIDs)
+        if self.block is None:
+            self.block = store.getBlock(self.ID) if store else Block(self.shape.blockSize)
+            self.receivedBlock = Block(self.shape.blockSize)
         self.rowNeighbors = collections.defaultdict(dict)
         self.columnNeighbors = collections.defaultdict(dict)
+        self.rowNeighborLists = {}
+        self.columnNeighborLists = {}
+        self.neighborList = []
+        self.links = [] # (dim, lineID, neighbor), in the order of neighborList
+
+        # complete rows (0..blockSize-1) and columns (blockSize..2*blockSize-1)
+        self.completeLines = np.zeros(2 * self.shape.blockSize, dtype=bool)
+        self.completeLinesChanged = True
+        self.validated = 0
 
-        #statistics
-        self.statsTxInSlot = 0
-        self.statsTxPerSlot = []
-        self.statsRxInSlot = 0
-        self.statsRxPerSlot = []
-        self.statsRxDupInSlot = 0
-        self.statsRxDupPerSlot = []
+        # traffic counters of the network, set by the simulator (see DAS/traffic.py)
+        self.traffic = None
+        self.sentInStep = 0 # segments sent in the step sendStep, against bwUplink
+        self.sendStep = -1
 
         # Set uplink bandwidth. 
         # Assuming segments of ~560 bytes and timesteps of 50ms, we get
@@ -108,14 +186,32 @@ class Validator:
         self.dumbRandomScheduler = False # dumb random scheduler
         self.segmentShuffleScheduler = True # send each segment that's worth sending once in shuffled order, then repeat
         self.segmentShuffleSchedulerPersist = True # Persist scheduler state between timesteps
+        self.plannedDispersal = True # a proposer that only publishes sends from a plan computed once, see planDispersal
+
+    def __getstate__(self):
+        """It returns the node state for snapshots, without the trace.
+
+            Generators cannot be pickled, so the state of the segment shuffle
+            scheduler is replaced (also in this node) by an iterator on its
+            remaining segments, which yields the same segments.
+        """
+        if self.segmentShuffleGen is not None:
+            self.segmentShuffleGen = iter(list(self.segmentShuffleGen))
+        index = self.blockFields.index("segmentShuffleGen")
+        for fields, neighStates in self.blockStates.values():
+            if fields[index] is not None:
+                fields[index] = iter(list(fields[index]))
+        state = self.__dict__.copy()
+        state["trace"] = None
+        return state
 
     def logIDs(self):
         """It logs the assigned rows and columns."""
         if self.amIproposer == 1:
             self.logger.warning("I am a block proposer."% self.ID)
         else:
-            self.logger.debug("Selected rows: "+str(self.rowIDs), extra=self.format)
-            self.logger.debug("Selected columns: "+str(self.columnIDs), extra=self.format)
+            self.logger.debug("Selected rows: %s", self.rowIDs, extra=self.format)
+            self.logger.debug("Selected columns: %s", self.columnIDs, extra=self.format)
 
     def initBlock(self):
         """It initializes the block for the proposer."""
@@ -123,60 +219,85 @@ class Validator:
             self.logger.warning("I am not a block proposer", extra=self.format)
         else:
             self.logger.debug("Creating block...", extra=self.format)
-            if self.shape.failureModel == "random":
-                order = [i for i in range(self.shape.blockSize * self.shape.blockSize)]
-                order = random.sample(order, int((1 - self.shape.failureRate/100) * len(order)))
-                for i in order:
-                    self.block.data[i] = 1
-            elif self.shape.failureModel == "sequential":
-                order = [i for i in range(self.shape.blockSize * self.shape.blockSize)]
-                order = order[:int((1 - self.shape.failureRate/100) * len(order))]
-                for i in order:
-                    self.block.data[i] = 1
-            elif self.shape.failureModel == "MEP": # Minimal size non-recoverable Erasure Pattern
-                for r in range(self.shape.blockSize):
-                    for c in range(self.shape.blockSize):
-                        k = self.shape.blockSize/2
-                        if r > k or c > k:
-                            self.block.setSegment(r,c)
-            elif self.shape.failureModel == "MEP+1": # MEP +1 segment to make it recoverable
-                for r in range(self.shape.blockSize):
-                    for c in range(self.shape.blockSize):
-                        k = self.shape.blockSize/2
-                        if r > k or c > k:
-                            self.block.setSegment(r,c)
-                self.block.setSegment(0, 0)
-            elif self.shape.failureModel == "DEP":
-                for r in range(self.shape.blockSize):
-                    for c in range(self.shape.blockSize):
-                        k = self.shape.blockSize/2
-                        if (r+c) % self.shape.blockSize > k:
-                            self.block.setSegment(r,c)
-            elif self.shape.failureModel == "DEP+1":
-                for r in range(self.shape.blockSize):
-                    for c in range(self.shape.blockSize):
-                        k = self.shape.blockSize/2
-                        if (r+c) % self.shape.blockSize > k:
-                            self.block.setSegment(r,c)
-                self.block.setSegment(0, 0)
-            elif self.shape.failureModel == "MREP": # Minimum size Recoverable Erasure Pattern
-                for r in range(self.shape.blockSize):
-                    for c in range(self.shape.blockSize):
-                        k = self.shape.blockSize/2
-                        if r < k and c < k:
-                            self.block.setSegment(r,c)
-            elif self.shape.failureModel == "MREP-1": # make MREP non-recoverable
-                for r in range(self.shape.blockSize):
-                    for c in range(self.shape.blockSize):
-                        k = self.shape.blockSize/2
-                        if r < k and c < k:
-                            self.block.setSegment(r,c)
-                self.block.setSegment(0, 0, 0)
+            if self.shape.failureModel not in failureModels:
+                self.logger.error("Unknown failure model %s" % self.shape.failureModel, extra=self.format)
+                return
+            rng = self.streams.generator("failures", blockID=self.blockID)
+            self.block.data |= failurePattern(self.shape.failureModel, self.shape.blockSize, self.shape.failureRate, rng)
 
             nbFailures = self.block.data.count(0)
             measuredFailureRate = nbFailures * 100 / (self.shape.blockSize * self.shape.blockSize)
             self.logger.debug("Number of failures: %d (%0.02f %%)", nbFailures, measuredFailureRate, extra=self.format)
 
+    def indexNeighbors(self):
+        """It caches the neighbors of each line as lists, once the network is set up."""
+        self.rowNeighborLists = {id: list(self.rowNeighbors[id].values()) for id in self.rowIDs}
+        self.columnNeighborLists = {id: list(self.columnNeighbors[id].values()) for id in self.columnIDs}
+        self.neighborList = list(chain(chain.from_iterable(self.rowNeighborLists.values()),
+                                       chain.from_iterable(self.columnNeighborLists.values())))
+        self.links = [(0, id, neigh) for id, neighs in self.rowNeighborLists.items() for neigh in neighs]
+        self.links += [(1, id, neigh) for id, neighs in self.columnNeighborLists.items() for neigh in neighs]
+        for position, (dim, id, neigh) in enumerate(self.links):
+            neigh.position = position
+
+    def saveBlock(self):
+        """It stores the state of the current block (node and links) in blockStates."""
+        if self.blockID is not None:
+            fields = [getattr(self, field) for field in self.blockFields]
+            self.blockStates[self.blockID] = (fields, [neigh.saveState() for neigh in self.neighborList])
+
+    def newBlock(self, blockID):
+        """It switches to a new block, with empty state."""
+        self.saveBlock()
+        if isinstance(self.block, SparseBlock):
+            self.block = SparseBlock(self.shape.blockSize, self.rowIDs, self.columnIDs)
+            self.receivedBlock = SparseBlock(self.shape.blockSize, self.rowIDs, self.columnIDs)
+        else:
+            self.block = Block(self.shape.blockSize)
+            self.receivedBlock = Block(self.shape.blockSize)
+        self.receivedQueue = deque()
+        self.sendQueue = deque()
+        self.activeQueues = set()
+        self.queueRing = []
+        self.newQueues = []
+        self.completeLines = np.zeros(2 * self.shape.blockSize, dtype=bool)
+        self.completeLinesChanged = True
+        self.validated = 0
+        self.segmentShuffleGen = None
+        for neigh in self.neighborList:
+            neigh.resetState()
+        self.blockID = blockID
+
+    def useBlock(self, blockID):
+        """It switches the node and its links to the state of a given block.
+
+            Several blocks can be in flight on the same network. All methods act
+            on the current block, except the traffic statistics and the timing
+            wheel, which are shared by all blocks.
+        """
+        if blockID == self.blockID:
+            return
+        self.saveBlock()
+        fields, neighStates = self.blockStates.pop(blockID)
+        for field, value in zip(self.blockFields, fields):
+            setattr(self, field, value)
+        for neigh, state in zip(self.neighborList, neighStates):
+            neigh.loadState(state)
+        self.blockID = blockID
+
+    def dropBlock(self, blockID):
+        """It discards the state of a finished block, including its segments in flight."""
+        self.blockStates.pop(blockID, None)
+        if blockID == self.blockID:
+            self.blockID = None
+        for bucket in self.inbound:
+            bucket[:] = [entry for entry in bucket if entry[0] != blockID]
+        del self.inFlight[blockID]
+
+    def queuedSegments(self):
+        """It returns the number of segments waiting in the send queues of the current block."""
+        return len(self.sendQueue) + sum(len(neigh.sendQueue) for neigh in self.neighborList)
+
     def getColumn(self, index):
         """It returns a given column."""
         return self.block.getColumn(index)
@@ -185,24 +306,69 @@ class Validator:
         """It returns a given row."""
         return self.block.getRow(index)
 
-    def receiveSegment(self, rID, cID, src):
-        """Receive a segment, register it, and queue for forwarding as needed."""
-        # register receive so that we are not sending back
-        if rID in self.rowIDs:
+    def receiveLine(self, src, dim, lineID, segments):
+        """Receive the segments of a line sent on a link, register them, and queue new ones for forwarding.
+
+            Returns: the segments that were new to the node.
+        """
+        count = segments.count(1)
+        if dim == 0:
+            rID = lineID
+            # register receive so that we are not sending back
             if src in self.rowNeighbors[rID]:
-                self.rowNeighbors[rID][src].receiving[cID] = 1
-        if cID in self.columnIDs:
-            if src in self.columnNeighbors[cID]:
-                self.columnNeighbors[cID][src].receiving[rID] = 1
-        if not self.receivedBlock.getSegment(rID, cID):
-            self.logger.trace("Recv new: %d->%d: %d,%d", src, self.ID, rID, cID, extra=self.format)
-            self.receivedBlock.setSegment(rID, cID)
-            if self.perNodeQueue or self.perNeighborQueue:
-                self.receivedQueue.append((rID, cID))
+                self.rowNeighbors[rID][src].receiving |= segments
+            crossing = segments & self.columnMask
+            if crossing.any():
+                for cID in crossing.search(1):
+                    if src in self.columnNeighbors[cID]:
+                        self.columnNeighbors[cID][src].receiving[rID] = 1
+            new = segments & ~self.receivedBlock.getRow(rID)
+            self.receivedBlock.mergeRow(rID, segments)
         else:
-            self.logger.trace("Recv DUP: %d->%d: %d,%d", src, self.ID, rID, cID, extra=self.format)
-            self.statsRxDupInSlot += 1
-        self.statsRxInSlot += 1
+            cID = lineID
+            if src in self.columnNeighbors[cID]:
+                self.columnNeighbors[cID][src].receiving |= segments
+            crossing = segments & self.rowMask
+            if crossing.any():
+                for rID in crossing.search(1):
+                    if src in self.rowNeighbors[rID]:
+                        self.rowNeighbors[rID][src].receiving[cID] = 1
+            new = segments & ~self.receivedBlock.getColumn(cID)
+            self.receivedBlock.mergeColumn(cID, segments)
+        newCount = new.count(1)
+        self.logger.trace("Recv %d->%d: %s %d, %d new, %d DUP", src, self.ID, "column" if dim else "row", lineID, newCount, count - newCount, extra=self.format)
+        if newCount and (self.perNodeQueue or self.perNeighborQueue):
+            self.receivedQueue.append((dim, lineID, new))
+        counters = self.traffic.current
+        counters[TrafficCounters.RX, self.ID] += count
+        counters[TrafficCounters.RXDUP, self.ID] += count - newCount
+        return new
+
+    def initInbound(self, maxDelay):
+        """It sizes the timing wheel of inbound links for the largest link delay."""
+        self.inbound = [[] for i in range(maxDelay + 1)]
+
+    def receiveInbound(self):
+        """Deliver the outboxes of the current block arriving at this node in the step.
+
+            When tracing, the segments of an outbox are recorded as sent (at the
+            step they were sent) and received when it is delivered. Outboxes
+            arriving at a stopped node are dropped.
+        """
+        bucket = self.inbound[self.step % len(self.inbound)]
+        pending = []
+        for entry in bucket:
+            blockID, src, dim, lineID, outbox, sent = entry
+            if blockID == self.blockID:
+                if not self.stopped:
+                    new = self.receiveLine(src, dim, lineID, outbox)
+                    if self.trace:
+                        self.trace.recordDelivery(sent, self.step, blockID, src, self.ID, dim, lineID, outbox, new)
+                outbox.setall(0)
+            else:
+                pending.append(entry)
+        self.inFlight[self.blockID] -= len(bucket) - len(pending)
+        bucket[:] = pending
 
     def addToSendQueue(self, rID, cID):
         """Queue a segment for forwarding."""
@@ -210,22 +376,33 @@ class Validator:
             self.sendQueue.append((rID, cID))
 
         if self.perNeighborQueue:
-            if rID in self.rowIDs:
-                for neigh in self.rowNeighbors[rID].values():
+            if self.rowMask[rID]:
+                for neigh in self.rowNeighborLists[rID]:
                     neigh.sendQueue.append(cID)
+                    if neigh.position not in self.activeQueues:
+                        self.activeQueues.add(neigh.position)
+                        self.newQueues.append(neigh.position)
 
-            if cID in self.columnIDs:
-                for neigh in self.columnNeighbors[cID].values():
+            if self.columnMask[cID]:
+                for neigh in self.columnNeighborLists[cID]:
                     neigh.sendQueue.append(rID)
+                    if neigh.position not in self.activeQueues:
+                        self.activeQueues.add(neigh.position)
+                        self.newQueues.append(neigh.position)
 
-    def receiveRowsColumns(self):
+    def receiveRowsColumns(self, step = 0):
         """Finalize time step by merging newly received segments in state."""
+        self.step = step
         if self.amIproposer == 1:
             self.logger.error("I am a block proposer", extra=self.format)
         else:
             self.logger.trace("Receiving the data...", extra=self.format)
             #self.logger.debug("%s -> %s", self.block.data, self.receivedBlock.data, extra=self.format)
 
+            self.receiveInbound()
+            if self.stopped:
+                return
+
             self.block.merge(self.receivedBlock)
 
             for neighs in chain (self.rowNeighbors.values(), self.columnNeighbors.values()):
@@ -236,18 +413,13 @@ class Validator:
             # add newly received segments to the send queue
             if self.perNodeQueue or self.perNeighborQueue:
                 while self.receivedQueue:
-                    (rID, cID) = self.receivedQueue.popleft()
-                    self.addToSendQueue(rID, cID)
-
-    def updateStats(self):
-        """It updates the stats related to sent and received data."""
-        self.logger.debug("Stats: tx %d, rx %d", self.statsTxInSlot, self.statsRxInSlot, extra=self.format)
-        self.statsRxPerSlot.append(self.statsRxInSlot)
-        self.statsRxDupPerSlot.append(self.statsRxDupInSlot)
-        self.statsTxPerSlot.append(self.statsTxInSlot)
-        self.statsRxInSlot = 0
-        self.statsRxDupInSlot = 0
-        self.statsTxInSlot = 0
+                    (dim, lineID, new) = self.receivedQueue.popleft()
+                    if dim == 0:
+                        for cID in new.search(1):
+                            self.addToSendQueue(lineID, cID)
+                    else:
+                        for rID in new.search(1):
+                            self.addToSendQueue(rID, lineID)
 
     def checkSegmentToNeigh(self, rID, cID, neigh):
         """Check if a segment should be sent to a neighbor."""
@@ -260,12 +432,35 @@ class Validator:
             return False # received or already sent
 
     def sendSegmentToNeigh(self, rID, cID, neigh):
-        """Send segment to a neighbor (without checks)."""
+        """Send segment to a neighbor (without checks).
+
+            The segment is added to the outbox of the link for this step. On the
+            first segment of the step, the outbox is registered in the timing
+            wheel of the receiving node, at the step it arrives.
+        """
         self.logger.trace("sending %d/%d to %d", rID, cID, neigh.node.ID, extra=self.format)
         i = rID if neigh.dim else cID
         neigh.sent[i] = 1
-        neigh.node.receiveSegment(rID, cID, self.ID)
-        self.statsTxInSlot += 1
+        outbox = neigh.outboxes[self.step % len(neigh.outboxes)]
+        if neigh.outboxStep != self.step:
+            neigh.outboxStep = self.step
+            wheel = neigh.node.inbound
+            wheel[(self.step + neigh.delay) % len(wheel)].append((self.blockID, self.ID, neigh.dim, cID if neigh.dim else rID, outbox, self.step))
+            neigh.node.inFlight[self.blockID] += 1
+        outbox[i] = 1
+        self.sentInStep += 1
+
+    def sendSegmentsToNeigh(self, lineID, segments, neigh):
+        """Send the segments of a line (bitarray) to a neighbor at once (without checks), see sendSegmentToNeigh."""
+        neigh.sent |= segments
+        outbox = neigh.outboxes[self.step % len(neigh.outboxes)]
+        if neigh.outboxStep != self.step:
+            neigh.outboxStep = self.step
+            wheel = neigh.node.inbound
+            wheel[(self.step + neigh.delay) % len(wheel)].append((self.blockID, self.ID, neigh.dim, lineID, outbox, self.step))
+            neigh.node.inFlight[self.blockID] += 1
+        outbox |= segments
+        self.sentInStep += segments.count()
 
     def checkSendSegmentToNeigh(self, rID, cID, neigh):
         """Check and send a segment to a neighbor if needed."""
@@ -284,18 +479,18 @@ class Validator:
         while self.sendQueue:
             (rID, cID) = self.sendQueue[0]
 
-            if rID in self.rowIDs:
-                for _, neigh in shuffledDict(self.rowNeighbors[rID], self.shuffleNeighbors):
+            if self.rowMask[rID]:
+                for neigh in shuffled(self.rowNeighborLists[rID], self.shuffleNeighbors, self.perms):
                     self.checkSendSegmentToNeigh(rID, cID, neigh)
 
-                if self.statsTxInSlot >= self.bwUplink:
+                if self.sentInStep >= self.bwUplink:
                     return
 
-            if cID in self.columnIDs:
-                for _, neigh in shuffledDict(self.columnNeighbors[cID], self.shuffleNeighbors):
+            if self.columnMask[cID]:
+                for neigh in shuffled(self.columnNeighborLists[cID], self.shuffleNeighbors, self.perms):
                     self.checkSendSegmentToNeigh(rID, cID, neigh)
 
-                if self.statsTxInSlot >= self.bwUplink:
+                if self.sentInStep >= self.bwUplink:
                     return
 
             self.sendQueue.popleft()
@@ -309,31 +504,37 @@ class Validator:
         of flows per topic and per peer. A per-peer model might be closer to the
         reality of libp2p implementations where topics between two nodes are
         multiplexed over the same transport.
-        """
-        progress = True
-        while (progress):
-            progress = False
-
-            queues = []
-            # collect and shuffle
-            for rID, neighs in self.rowNeighbors.items():
-                for neigh in neighs.values():
-                    if (neigh.sendQueue):
-                        queues.append((0, rID, neigh))
 
-            for cID, neighs in self.columnNeighbors.items():
-                for neigh in neighs.values():
-                    if (neigh.sendQueue):
-                        queues.append((1, cID, neigh))
-
-            for dim, lineID, neigh in shuffled(queues, self.shuffleQueues):
+        The non-empty queues are kept in a ring, served in turn. Queues that
+        became active since the last send join the ring in shuffled order, and
+        drained queues leave it. When the bandwidth runs out, the ring is rotated
+        so that the next step starts from the queue after the last one served.
+        """
+        if self.newQueues:
+            self.queueRing.extend(shuffled(self.newQueues, self.shuffleQueues, self.perms))
+            self.newQueues = []
+        ring = self.queueRing
+        full = False
+        while ring and not full:
+            drained = False
+            for position in ring:
+                dim, lineID, neigh = self.links[position]
                 if dim == 0:
                     self.checkSendSegmentToNeigh(lineID, neigh.sendQueue.popleft(), neigh)
                 else:
                     self.checkSendSegmentToNeigh(neigh.sendQueue.popleft(), lineID, neigh)
-                progress = True
-                if self.statsTxInSlot >= self.bwUplink:
-                    return
+                if not neigh.sendQueue:
+                    self.activeQueues.discard(position)
+                    drained = True
+                if self.sentInStep >= self.bwUplink:
+                    full = True
+                    break
+            if full:
+                index = ring.index(position) + 1
+                ring = ring[index:] + ring[:index]
+            if drained:
+                ring = [position for position in ring if position in self.activeQueues]
+        self.queueRing = ring
 
     def runSegmentShuffleScheduler(self):
         """ Schedule chunks for sending.
@@ -377,15 +578,15 @@ class Validator:
         def nextSegment():
             while True:
                 # send each collected segment once
-                if hasattr(self, 'segmentShuffleGen') and self.segmentShuffleGen is not None:
+                if self.segmentShuffleGen is not None:
                     for dim, lineID, id in self.segmentShuffleGen:
                         if dim == 0:
-                            for _, neigh in shuffledDict(self.rowNeighbors[lineID], self.shuffleNeighbors):
+                            for neigh in shuffled(self.rowNeighborLists[lineID], self.shuffleNeighbors, self.perms):
                                 if self.checkSegmentToNeigh(lineID, id, neigh):
                                     yield((lineID, id, neigh))
                                     break
                         else:
-                            for _, neigh in shuffledDict(self.columnNeighbors[lineID], self.shuffleNeighbors):
+                            for neigh in shuffled(self.columnNeighborLists[lineID], self.shuffleNeighbors, self.perms):
                                 if self.checkSegmentToNeigh(id, lineID, neigh):
                                     yield((id, lineID, neigh))
                                     break
@@ -397,18 +598,118 @@ class Validator:
                 if not segmentsToSend:
                     break
                 else:
-                    self.segmentShuffleGen = shuffled(segmentsToSend, self.shuffleLines)
+                    self.segmentShuffleGen = shuffled(segmentsToSend, self.shuffleLines, self.perms)
 
         for rid, cid, neigh in nextSegment():
             # segments are checked just before yield, so we can send directly
             self.sendSegmentToNeigh(rid, cid, neigh)
 
-            if self.statsTxInSlot >= self.bwUplink:
+            if self.sentInStep >= self.bwUplink:
                 if not self.segmentShuffleSchedulerPersist:
                     # remove scheduler state before leaving
                     self.segmentShuffleGen = None
                 return
 
+    def planDispersal(self):
+        """It computes the sends of a proposer that only publishes, once, before the first step.
+
+            Such a proposer never receives, so what its segment shuffle scheduler
+            sends only depends on its block and its own random draws. The
+            scheduler is replayed here on arrays, with the same draws in the same
+            order: each pass collects the segments some link still needs (below
+            the sendLineUntil cutoff), and sends each of them once, in shuffled
+            order, to the first link in shuffled order that needs it. Links only
+            carry one line, so the lines are replayed side by side, their k-th
+            segments at once. The sends are then cut into steps of bwUplink
+            segments, see sendPlanned.
+        """
+        if not (self.amIproposer and self.plannedDispersal and self.segmentShuffleScheduler
+                and self.segmentShuffleSchedulerPersist and not self.dumbRandomScheduler):
+            return
+        bs = self.shape.blockSize
+        targets = [] # (neighbor, lineID) of each link, grouped by line as in the scheduler
+        firstLink, numberLinks, data = [], [], []
+        for neighbors, neighborLists, getLine in ((self.rowNeighbors, self.rowNeighborLists, self.getRow),
+                                                  (self.columnNeighbors, self.columnNeighborLists, self.getColumn)):
+            for lineID in neighbors:
+                firstLink.append(len(targets))
+                numberLinks.append(len(neighborLists[lineID]))
+                targets.extend((neigh, lineID) for neigh in neighborLists[lineID])
+                data.append(np.frombuffer(getLine(lineID).unpack(), dtype=np.uint8))
+        firstLink, numberLinks = np.array(firstLink), np.array(numberLinks)
+        data = np.array(data, dtype=bool).reshape(len(numberLinks), bs)
+        # segments sent or received on each link
+        have = np.array([np.frombuffer((neigh.sent | neigh.received).unpack(), dtype=np.uint8) for neigh, lineID in targets],
+                        dtype=bool).reshape(len(targets), bs)
+        counts = have.sum(axis=1)
+        linked = numberLinks > 0
+        degree = int(numberLinks.max()) if len(numberLinks) else 0
+        links, segments = [], []
+        while True:
+            # collect the segments needed by a link below the cutoff, in the order of the scheduler
+            needed = np.zeros_like(data)
+            if len(targets):
+                needing = ~have & (counts < self.sendLineUntil)[:, None]
+                needed[linked] = np.logical_or.reduceat(needing, firstLink[linked], axis=0)
+            lineIndex, ids = np.nonzero(needed & data)
+            if not len(ids):
+                break
+            order = self.perms.permutation(len(ids)) if self.shuffleLines else range(len(ids))
+            lineIndex, ids = lineIndex[order], ids[order]
+            # order of the links tried for each segment, -1 past the links of its line
+            if not self.shuffleNeighbors:
+                tries = np.tile(np.arange(degree), (len(ids), 1))
+            elif (numberLinks[lineIndex] == degree).all():
+                tries = self.perms.permutations(degree, len(ids))
+            else:
+                tries = np.full((len(ids), degree), -1)
+                for s, count in enumerate(numberLinks[lineIndex].tolist()):
+                    tries[s, :count] = self.perms.permutation(count)
+            tries = np.where((tries >= 0) & (tries < numberLinks[lineIndex][:, None]), tries, -1)
+            # replay the lines side by side: the k-th segment of every line at once
+            byLine = np.argsort(lineIndex, kind="stable")
+            rank = np.empty(len(ids), dtype=np.int64)
+            lineStart = np.searchsorted(lineIndex[byLine], lineIndex[byLine])
+            rank[byLine] = np.arange(len(ids)) - lineStart
+            byRank = np.argsort(rank, kind="stable")
+            rankStart = np.searchsorted(rank[byRank], np.arange(int(rank.max()) + 2))
+            sentTo = np.full(len(ids), -1)
+            for k in range(len(rankStart) - 1):
+                position = byRank[rankStart[k]:rankStart[k+1]]
+                candidates = np.where(tries[position] >= 0, firstLink[lineIndex[position]][:, None] + tries[position], -1)
+                valid = candidates >= 0
+                candidates = np.where(valid, candidates, 0)
+                eligible = valid & ~have[candidates, ids[position][:, None]] & (counts[candidates] < self.sendLineUntil)
+                found = eligible.any(axis=1)
+                chosen = candidates[found, eligible[found].argmax(axis=1)]
+                have[chosen, ids[position][found]] = True
+                counts[chosen] += 1
+                sentTo[position[found]] = chosen
+            sent = sentTo >= 0
+            links.append(sentTo[sent])
+            segments.append(ids[sent])
+        links = np.concatenate(links).astype(np.int32) if links else np.zeros(0, dtype=np.int32)
+        segments = np.concatenate(segments).astype(np.int32) if segments else np.zeros(0, dtype=np.int32)
+        rate = max(math.ceil(self.bwUplink), 1)
+        self.dispersalPlan = (targets, links, segments, rate)
+
+    def sendPlanned(self):
+        """Send the segments of the dispersal plan for the current step, one line per link at once."""
+        targets, links, segments, rate = self.dispersalPlan
+        start = self.step * rate
+        if start >= len(links):
+            return
+        links, segments = links[start:start+rate], segments[start:start+rate]
+        used, first, inverse = np.unique(links, return_index=True, return_inverse=True)
+        masks = np.zeros((len(used), self.shape.blockSize), dtype=np.uint8)
+        masks[inverse, segments] = 1
+        # links in the order of their first segment, as the scheduler registers them
+        for k in np.argsort(first).tolist():
+            neigh, lineID = targets[used[k]]
+            bits = bitarray()
+            bits.pack(masks[k].tobytes())
+            self.sendSegmentsToNeigh(lineID, bits, neigh)
+
     def runDumbRandomScheduler(self, tries = 100):
         """Random scheduler picking segments at random.
 
@@ -422,18 +723,20 @@ class Validator:
             t = tries
             while t:
                 if self.rowIDs:
-                    rID = random.choice(self.rowIDs)
-                    cID = random.randrange(0, self.shape.blockSize)
+                    rID = self.rowIDs[self.rng.integers(len(self.rowIDs))]
+                    cID = int(self.rng.integers(self.shape.blockSize))
                     if self.block.getSegment(rID, cID) :
-                        neigh = random.choice(list(self.rowNeighbors[rID].values()))
+                        neighs = self.rowNeighborLists[rID]
+                        neigh = neighs[self.rng.integers(len(neighs))]
                         if self.checkSegmentToNeigh(rID, cID, neigh):
                             yield(rID, cID, neigh)
                             t = tries
                 if self.columnIDs:
-                    cID = random.choice(self.columnIDs)
-                    rID = random.randrange(0, self.shape.blockSize)
+                    cID = self.columnIDs[self.rng.integers(len(self.columnIDs))]
+                    rID = int(self.rng.integers(self.shape.blockSize))
                     if self.block.getSegment(rID, cID) :
-                        neigh = random.choice(list(self.columnNeighbors[cID].values()))
+                        neighs = self.columnNeighborLists[cID]
+                        neigh = neighs[self.rng.integers(len(neighs))]
                         if self.checkSegmentToNeigh(rID, cID, neigh):
                             yield(rID, cID, neigh)
                             t = tries
@@ -443,31 +746,61 @@ class Validator:
             # segments are checked just before yield, so we can send directly
             self.sendSegmentToNeigh(rid, cid, neigh)
 
-            if self.statsTxInSlot >= self.bwUplink:
+            if self.sentInStep >= self.bwUplink:
                 return
 
-    def send(self):
-        """ Send as much as we can in the timestep, limited by bwUplink."""
+    def sendBlocks(self, step, blockIDs):
+        """Send as much as we can in the timestep for several blocks, in the given order."""
+        self.startStep(step)
+        for blockID in blockIDs:
+            if self.sentInStep >= self.bwUplink or self.stopped:
+                return
+            self.useBlock(blockID)
+            self.send(step)
+
+    def startStep(self, step):
+        """It renews the uplink budget of the node for a new step (once per step, whatever the number of blocks)."""
+        if step != self.sendStep:
+            self.sendStep = step
+            self.sentInStep = 0
+
+    def send(self, step = 0):
+        """ Send as much as we can in the timestep, limited by bwUplink, and count it in the traffic counters."""
+        self.step = step
+        self.startStep(step)
+        if self.stopped:
+            return
+        sent = self.sentInStep
+        self.sendSegments()
+        self.traffic.current[TrafficCounters.TX, self.ID] += self.sentInStep - sent
+
+    def sendSegments(self):
+        """It sends segments of the current block from the queues, then the schedulers, until bwUplink is reached."""
+        if self.sentInStep >= self.bwUplink:
+            return
+        if self.dispersalPlan:
+            self.sendPlanned()
+            return
 
         # process node level send queue
         self.processSendQueue()
-        if self.statsTxInSlot >= self.bwUplink:
+        if self.sentInStep >= self.bwUplink:
             return
 
         # process neighbor level send queues in shuffled breadth-first order
         self.processPerNeighborSendQueue()
-        if self.statsTxInSlot >= self.bwUplink:
+        if self.sentInStep >= self.bwUplink:
             return
 
         # process possible segments to send in shuffled breadth-first order
         if self.segmentShuffleScheduler:
             self.runSegmentShuffleScheduler()
-        if self.statsTxInSlot >= self.bwUplink:
+        if self.sentInStep >= self.bwUplink:
             return
 
         if self.dumbRandomScheduler:
             self.runDumbRandomScheduler()
-        if self.statsTxInSlot >= self.bwUplink:
+        if self.sentInStep >= self.bwUplink:
             return
 
     def logRows(self):
@@ -484,63 +817,81 @@ class Validator:
 
     def restoreRows(self):
         """It restores the rows assigned to the validator, that can be repaired."""
-        if self.repairOnTheFly:
+        if self.repairOnTheFly and not self.stopped:
             for id in self.rowIDs:
-                self.restoreRow(id)
+                if not self.completeLines[id]:
+                    self.restoreRow(id)
 
     def restoreRow(self, id):
         """Restore a given row if repairable."""
         rep = self.block.repairRow(id)
         if (rep.any()):
+            self.completeLines[id] = True
+            self.completeLinesChanged = True
+            if self.trace:
+                self.trace.recordLine(self.step, self.blockID, REPAIR, self.ID, self.ID, 0, id, rep)
             # If operation is based on send queues, segments should
             # be queued after successful repair.
-            for i in range(len(rep)):
-                if rep[i]:
-                    self.logger.trace("Rep: %d,%d", id, i, extra=self.format)
-                    self.addToSendQueue(id, i)
+            for i in rep.search(1):
+                self.logger.trace("Rep: %d,%d", id, i, extra=self.format)
+                self.addToSendQueue(id, i)
             # self.statsRepairInSlot += rep.count(1)
 
     def restoreColumns(self):
         """It restores the columns assigned to the validator, that can be repaired."""
-        if self.repairOnTheFly:
+        if self.repairOnTheFly and not self.stopped:
             for id in self.columnIDs:
-                self.restoreColumn(id)
+                if not self.completeLines[self.shape.blockSize + id]:
+                    self.restoreColumn(id)
 
     def restoreColumn(self, id):
         """Restore a given column if repairable."""
         rep = self.block.repairColumn(id)
         if (rep.any()):
+            self.completeLines[self.shape.blockSize + id] = True
+            self.completeLinesChanged = True
+            if self.trace:
+                self.trace.recordLine(self.step, self.blockID, REPAIR, self.ID, self.ID, 1, id, rep)
             # If operation is based on send queues, segments should
             # be queued after successful repair.
-            for i in range(len(rep)):
-                if rep[i]:
-                    self.logger.trace("Rep: %d,%d", i, id, extra=self.format)
-                    self.addToSendQueue(i, id)
+            for i in rep.search(1):
+                self.logger.trace("Rep: %d,%d", i, id, extra=self.format)
+                self.addToSendQueue(i, id)
             # self.statsRepairInSlot += rep.count(1)
 
     def checkStatus(self):
-        """It checks how many expected/arrived samples are for each assigned row/column."""
-
-        def checkStatus(columnIDs, rowIDs):
-            arrived = 0
-            expected = 0
-            for id in columnIDs:
-                line = self.getColumn(id)
-                arrived += line.count(1)
-                expected += len(line)
-            for id in rowIDs:
-                line = self.getRow(id)
-                arrived += line.count(1)
-                expected += len(line)
-            return arrived, expected
-
-        arrived, expected = checkStatus(self.columnIDs, self.rowIDs)
+        """It checks how many expected/arrived samples are for each assigned row/column.
+
+            Lines found complete are marked in completeLines and not counted
+            again. The number of validated virtual validators is only
+            recomputed when new lines are complete.
+        """
+        bs = self.shape.blockSize
+        arrived = 0
+        for id in self.rowIDs:
+            if self.completeLines[id]:
+                arrived += bs
+                continue
+            count = self.getRow(id).count(1)
+            if count == bs:
+                self.completeLines[id] = True
+                self.completeLinesChanged = True
+            arrived += count
+        for id in self.columnIDs:
+            if self.completeLines[bs + id]:
+                arrived += bs
+                continue
+            count = self.getColumn(id).count(1)
+            if count == bs:
+                self.completeLines[bs + id] = True
+                self.completeLinesChanged = True
+            arrived += count
+        expected = bs * (len(self.rowIDs) + len(self.columnIDs))
         self.logger.debug("status: %d / %d", arrived, expected, extra=self.format)
 
-        validated = 0
-        for i in range(self.vpn):
-            a, e = checkStatus(self.vColumnIDs[i], self.vRowIDs[i])
-            if a == e:
-                validated+=1
+        if self.completeLinesChanged:
+            # a virtual validator is validated if all its required lines are complete
+            self.validated = int(self.completeLines[self.requiredLines].all(axis=1).sum())
+            self.completeLinesChanged = False
 
-        return arrived, expected, validated
+        return arrived, expected, self.validated
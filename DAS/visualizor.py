@@ -61,7 +61,7 @@ class Visualizor:
         conf["ylabel"] = "Number of Missing Samples"
         conf["data"] = [result.missingVector]
         conf["xdots"] = [x*self.config.stepDuration for x in range(len(result.missingVector))]
-        conf["path"] = "results/"+self.execID+"/plots/missingSamples-"+str(result.shape)+".png"
+        conf["path"] = "results/"+self.execID+"/plots/missingSamples-"+result.label()+".png"
         maxi = 0
         for v in conf["data"]:
             if max(v) > maxi:
@@ -89,7 +89,7 @@ class Visualizor:
         conf["ylabel"] = "Percentage (%)"
         conf["data"] = [vector1, vector2, vector3]
         conf["xdots"] = [x*self.config.stepDuration for x in range(len(vector1))]
-        conf["path"] = "results/"+self.execID+"/plots/nodesReady-"+str(result.shape)+".png"
+        conf["path"] = "results/"+self.execID+"/plots/nodesReady-"+result.label()+".png"
         maxi = 0
         for v in conf["data"]:
             if max(v) > maxi:
@@ -121,7 +121,7 @@ class Visualizor:
         conf["ylabel"] = "Bandwidth (MBits/s)"
         conf["data"] = [vector1, vector2, vector3]
         conf["xdots"] = [x*self.config.stepDuration for x in range(len(vector1))]
-        conf["path"] = "results/"+self.execID+"/plots/sentData-"+str(result.shape)+".png"
+        conf["path"] = "results/"+self.execID+"/plots/sentData-"+result.label()+".png"
         maxi = 0
         for v in conf["data"]:
             if max(v) > maxi:
@@ -151,7 +151,7 @@ class Visualizor:
         conf["ylabel"] = "Bandwidth (MBits/s)"
         conf["data"] = [vector1, vector2]
         conf["xdots"] = [x*self.config.stepDuration for x in range(len(vector1))]
-        conf["path"] = "results/"+self.execID+"/plots/recvData-"+str(result.shape)+".png"
+        conf["path"] = "results/"+self.execID+"/plots/recvData-"+result.label()+".png"
         maxi = 0
         for v in conf["data"]:
             if max(v) > maxi:
@@ -181,7 +181,7 @@ class Visualizor:
         conf["ylabel"] = "Bandwidth (MBits/s)"
         conf["data"] = [vector1, vector2]
         conf["xdots"] = [x*self.config.stepDuration for x in range(len(vector1))]
-        conf["path"] = "results/"+self.execID+"/plots/dupData-"+str(result.shape)+".png"
+        conf["path"] = "results/"+self.execID+"/plots/dupData-"+result.label()+".png"
         maxi = 0
         for v in conf["data"]:
             if max(v) > maxi:
@@ -208,7 +208,7 @@ class Visualizor:
         conf["ylabel"] = "Validators subscribed"
         conf["data"] = [vector1, vector2]
         conf["xdots"] = range(len(vector1))
-        conf["path"] = "results/"+self.execID+"/plots/RowColDist-"+str(result.shape)+".png"
+        conf["path"] = "results/"+self.execID+"/plots/RowColDist-"+result.label()+".png"
         maxi = 0
         for v in conf["data"]:
             if max(v) > maxi:
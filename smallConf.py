@@ -30,6 +30,9 @@ plotProgress = 1
 # Save row and column distributions
 saveRCdist = 1
 
+# Save traffic percentiles per node class and the peak step traffic of each node
+saveTrafficDist = 1
+
 # Plot all figures
 visualization = 1
 
@@ -44,6 +47,54 @@ numJobs = -1
 # or generate it using local randomness (False)
 evenLineDistribution = True
 
+# Store only the rows/columns a node is in custody of (True), instead of
+# the full block (False). Saves memory for large blocks.
+sparseBlocks = False
+
+# Keep the blocks of all nodes in a memory-mapped file in the results folder
+# (True), so that the network state can be inspected from another process.
+# Only used with sparseBlocks = False.
+mmapBlockStore = False
+
+# Record every segment sent, received and repaired in a binary trace file in
+# the results folder (trace-<shape>.trace), to replay and analyse the
+# simulation afterwards with DAS.trace.EventTrace.
+traceEvents = False
+
+# Steps at which the state of the simulation is saved in the results folder
+# (<shape>-step-<step>.snapshot), e.g. [5, 15]. A snapshot can be restored
+# with Simulator.restore, to run variants from it (see Simulator.whatIf).
+# Only used with numberBlocks = 1.
+snapshotSteps = []
+
+# Predict the availability and TTA bounds of each shape with a fast analytical
+# surrogate, and only simulate the shapes where it is uncertain: availability
+# unknown, or available with TTA bounds more than screenTolerance ms apart.
+# Predicted results are labelled (surrogate), their tta is the upper bound, and
+# they are dumped in results/<execID>/surrogate, out of the result cube and plots.
+screenShapes = False
+screenTolerance = 100
+
+# Simulate shapes that only differ by unused parameters once (e.g. vpn2 with
+# class1ratio 1.0, or failureRate with the MEP failure model), and copy the
+# results to the others
+planShapes = True
+
+# Dispatch the shapes in decreasing order of estimated run time, one at a time,
+# so that the longest shapes do not start last. Run times are estimated from
+# the past simulations in the results folder.
+orderByCost = True
+
+# Report the progress of the sweep every statusInterval seconds, on the terminal
+# and in results/<execID>/status/status.json (0 to disable)
+statusInterval = 10
+
+# Memory budget of the sweep in MB (0 for no limit). Shapes are only started
+# while the memory predicted for the running shapes fits in the budget, smaller
+# shapes running around the big ones. Memory is predicted from past simulations
+# in the results folder.
+memoryBudget = 0
+
 # Number of simulation runs with the same parameters for statistical relevance
 runs = range(3)
 
@@ -51,6 +102,7 @@ runs = range(3)
 numberNodes = range(128, 513, 128)
 
 # select failure model between: "random, sequential, MEP, MEP+1, DEP, DEP+1, MREP, MREP-1"
+# More models can be added with the DAS.failures.failureModel decorator
 failureModels = ["random"]
 
 # Percentage of block not released by producer
@@ -80,6 +132,19 @@ bwUplinks2 = [200]
 # Step duration in miliseconds (Classic RTT is about 100ms)
 stepDuration = 50
 
+# One-way latency of the p2p links in miliseconds, drawn once per link:
+# ("constant", ms), ("uniform", min, max) or ("normal", mean, std).
+# It is rounded down to whole steps: a segment sent at step k on a link with a
+# latency of d steps is received at step k+d. ("constant", 0) is the synchronous model.
+linkLatency = ("constant", 0)
+
+# Number of consecutive blocks disseminated on the same network, one every
+# blockSpacing steps (e.g. 12 steps of 50ms for 600ms slots). Blocks in flight
+# share the uplink of the nodes, oldest block first, and results are recorded
+# per block. With more than one block, mmapBlockStore is not used.
+numberBlocks = 1
+blockSpacing = 12
+
 # Segment size in bytes (with proof)
 segmentSize = 560
 
@@ -92,9 +157,21 @@ randomSeed = "DAS"
 # Number of steps without progress to stop simulation
 steps4StopCondition = 7
 
+# Stop the simulation after the first step if the initial block cannot be
+# repaired enough to ever reach successCondition (checked with a peeling
+# decoder), instead of waiting for steps4StopCondition steps without progress.
+skipUnrecoverable = False
+
 # Number of validators ready to asume block is available
 successCondition = 0.9
 
+# Simulate random sampling after dispersal: each node samples numberSamples
+# segments from custodians of their row or column, retrying the missing ones
+# at each step, for at most samplingSteps steps
+samplingPhase = False
+numberSamples = 75
+samplingSteps = 10
+
 # If True, print diagnostics when the block is not available
 diagnostics = False
 
@@ -25,21 +25,49 @@ def initLogger(config):
 
 def runOnce(config, shape, execID):
 
+    status = None
+    if config.statusInterval:
+        status = WorkerStatus.get("results/"+execID+"/status", config.statusInterval)
+        status.start(str(shape))
+
     if config.deterministic:
         shape.setSeed(config.randomSeed+"-"+str(shape))
         random.seed(shape.randomSeed)
 
+    resetPeakRSS()
+    startRSS = currentRSS()
+    start = time.time()
     sim = Simulator(shape, config, execID)
+    if status:
+        sim.stepCallback = status.step
     sim.initLogger()
     sim.initValidators()
     sim.initNetwork()
-    result = sim.run()
-    sim.logger.info("Shape: %s ... Block Available: %d in %d steps" % (str(sim.shape.__dict__), result.blockAvailable, len(result.missingVector)), extra=sim.format)
-
-    if config.dumpXML:
-        result.dump()
-
-    return result
+    if config.numberBlocks > 1:
+        results = sim.runBlocks()
+    else:
+        result = None
+        for step in sorted(config.snapshotSteps):
+            result = sim.run(until=step)
+            if result:
+                break
+            os.makedirs("results/"+execID, exist_ok=True)
+            with open("results/"+execID+"/"+str(shape)+"-step-"+str(step)+".snapshot", "wb") as f:
+                f.write(sim.snapshot())
+        results = [result or sim.run()]
+    runTime = time.time() - start
+    memory = peakRSS() - startRSS
+    if status:
+        status.finish()
+    for result in results:
+        result.runTime = runTime
+        result.memory = memory
+        sim.logger.info("Shape: %s ... Block %s Available: %d in %d steps" % (str(sim.shape.__dict__), result.blockID, result.blockAvailable, len(result.missingVector)), extra=sim.format)
+
+        if config.dumpXML:
+            result.dump()
+
+    return results
 
 def study():
     if len(sys.argv) < 2:
@@ -77,17 +105,77 @@ def study():
            subprocess.run(["git", "describe", "--always"], stdout=f)
     subprocess.run(["cp", sys.argv[1], dir+"/"])
 
+    if config.planShapes:
+        planner = Planner(config.nextShape())
+        shapes = list(planner.nextShape())
+        logger.info("Planned %d simulations for %d shapes" % (len(shapes), len(planner.shapes)), extra=format)
+    else:
+        shapes = list(config.nextShape())
+
+    screened = {}
+    if config.screenShapes:
+        surrogate = Surrogate(config)
+        for i, shape in enumerate(shapes):
+            if config.deterministic:
+                shape.setSeed(config.randomSeed+"-"+str(shape))
+            estimate = surrogate.estimate(shape)
+            if surrogate.screens(estimate):
+                screened[i] = [surrogate.result(shape, execID, estimate)]
+                if config.dumpXML:
+                    screened[i][0].dump()
+        logger.info("The surrogate predicted %d of %d shapes" % (len(screened), len(shapes)), extra=format)
+
+    order = [i for i in range(len(shapes)) if i not in screened]
+    batchSize = "auto"
+    if config.orderByCost or config.statusInterval:
+        costModel = CostModel.fromResults("results")
+        costs = {i: costModel.estimate(shapes[i]) for i in order}
+        logger.info("Cost model fitted on %d past simulations" % costModel.samples, extra=format)
+    if config.orderByCost:
+        # longest shapes first, handed out one at a time to the free workers
+        order = sorted(order, key=lambda i: -costs[i])
+        batchSize = 1
+
+    monitor = None
+    if config.statusInterval:
+        os.makedirs(dir+"/status", exist_ok=True)
+        monitor = SweepMonitor(dir+"/status", [str(shapes[i]) for i in order], [costs[i] for i in order], config.statusInterval, logger)
+        monitor.start()
+
     logger.info("Starting simulations:", extra=format)
     start = time.time()
-    results = Parallel(config.numJobs)(delayed(runOnce)(config, shape ,execID) for shape in config.nextShape())
+    if config.memoryBudget:
+        memoryModel = MemoryModel.fromResults("results")
+        memories = [memoryModel.estimate(shapes[i]) for i in order]
+        logger.info("Memory model fitted on %d past simulations, largest shape %d MB" % (memoryModel.samples, max(memories, default=0)), extra=format)
+        scheduler = AdmissionScheduler(numberWorkers(config.numJobs), config.memoryBudget, currentRSS())
+        results = scheduler.run(runOnce, [(config, shapes[i], execID) for i in order], memories)
+    else:
+        results = Parallel(config.numJobs, batch_size=batchSize)(delayed(runOnce)(config, shapes[i], execID) for i in order)
+    results = dict(zip(order, results))
+    results.update(screened)
+    results = [results[i] for i in range(len(shapes))]
+    if monitor:
+        monitor.stop()
+    if config.planShapes:
+        results = planner.fanOut(results)
+        if config.dumpXML:
+            for result in results:
+                if result.aliasOf is not None:
+                    result.dump()
+    else:
+        results = [result for shapeResults in results for result in shapeResults]
     end = time.time()
-    logger.info("A total of %d simulations ran in %d seconds" % (len(results), end-start), extra=format)
+    logger.info("A total of %d simulations ran in %d seconds" % (sum(result.aliasOf is None and not result.surrogate for result in results), end-start), extra=format)
+
+    if config.dumpXML:
+        ResultCube.load("results/"+execID)
 
     if config.visualization:
         vis = Visualizer(execID, config)
         vis.plotHeatmaps()
 
-        visual = Visualizor(execID, config, results)
+        visual = Visualizor(execID, config, [result for result in results if not result.surrogate])
         visual.plotAll()
 
 if __name__ == "__main__":
@@ -0,0 +1,40 @@
+import types
+import logging
+import pytest
+import numpy as np
+import smallConf
+from DAS.shape import Shape
+from DAS.simulator import Simulator
+
+def simulate(shape, linkLatency, planned):
+    """It runs a shape with or without the dispersal plan of the proposer, and returns the simulator and result."""
+    config = types.SimpleNamespace(**{k: v for k, v in vars(smallConf).items() if not k.startswith("__")})
+    config.logLevel = logging.WARNING
+    config.linkLatency = linkLatency
+    sim = Simulator(shape, config, "test")
+    sim.initLogger()
+    sim.initValidators()
+    sim.validators[sim.proposerID].plannedDispersal = planned
+    sim.initNetwork()
+    return sim, sim.run()
+
+@pytest.mark.parametrize("blockSize, numberNodes, failureRate, netDegree, bwUplinkProd, linkLatency", [
+    (32, 128, 40, 8, 200, ("constant", 0)),
+    (32, 128, 0, 8, 20, ("uniform", 0, 150)),
+    (16, 24, 20, 8, 50, ("normal", 100, 40)), # lines with fewer custodians than netDegree
+    (32, 64, 70, 6, 200, ("constant", 60)),
+])
+def testPlanMatchesScheduler(blockSize, numberNodes, failureRate, netDegree, bwUplinkProd, linkLatency):
+    """The dispersal plan sends the same segments to the same links at the same steps as the segment shuffle scheduler."""
+    shape = Shape(blockSize, numberNodes, "random", failureRate, 0.8, 2, 1, 4, netDegree, bwUplinkProd, 10, 200, 0)
+    shape.setSeed("DAS-test-"+str(shape))
+    planned, plannedResult = simulate(shape, linkLatency, True)
+    generic, genericResult = simulate(shape, linkLatency, False)
+    assert planned.validators[planned.proposerID].dispersalPlan is not None
+    assert generic.validators[generic.proposerID].dispersalPlan is None
+    assert plannedResult.missingVector == genericResult.missingVector
+    for name, values in plannedResult.metrics["progress"].items():
+        assert np.array_equal(values, genericResult.metrics["progress"][name], equal_nan=True)
+    for a, b in zip(planned.validators, generic.validators):
+        assert a.block.data == b.block.data
+        assert [(n.node.ID, n.sent, n.received) for n in a.neighborList] == [(n.node.ID, n.sent, n.received) for n in b.neighborList]
@@ -0,0 +1,13 @@
+from DAS.memory import MemoryModel
+from DAS.shape import Shape
+
+def shape(blockSize, numberNodes):
+    return Shape(blockSize, numberNodes, "random", 20, 0.8, 2, 1, 2, 8, 200, 10, 200, 0)
+
+def testPriorWithoutHistory(tmp_path):
+    """With no recorded memory, shapes are estimated at two blocks per node plus the overhead."""
+    model = MemoryModel.fromResults(str(tmp_path))
+    assert model.samples == 0
+    blocks = 1024 * 2 * 512**2 / 8 / 2**20
+    assert abs(model.estimate(shape(512, 1024)) - (blocks + MemoryModel.overhead)) < 1e-6
+    assert model.estimate(shape(512, 1024)) > model.estimate(shape(32, 128)) >= MemoryModel.overhead